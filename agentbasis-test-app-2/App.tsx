@@ -152,10 +152,12 @@ const App: React.FC = () => {
         console.log('✅ Using most recent chat:', existingChats[0].id);
         setChats(existingChats);
         setCurrentChatId(existingChats[0].id);
-        // Load its SQL explicitly (list endpoint doesn't include latest_sql)
+        // The list includes latest_sql for the most recent chat; fetch it only if missing
         try {
           console.log('📄 Loading chat SQL...');
-          const chatDetails = await BackendService.getChat(existingChats[0].id);
+          const chatDetails = typeof existingChats[0].latest_sql === 'string'
+            ? existingChats[0]
+            : await BackendService.getChat(existingChats[0].id);
           if (chatDetails.latest_sql) {
             setSql(formatSqlSafely(chatDetails.latest_sql));
           } else {
@@ -302,7 +304,7 @@ const App: React.FC = () => {
       // Stream from backend (no history sent)
       const stream = BackendService.streamAgentResponse(userMessage, chatId);
       
-      let lastFullText = '';
+      let streamedText = '';
       
       for await (const event of stream) {
         if (event.event === 'tool' && event.data.name && event.data.status) {
@@ -350,10 +352,11 @@ const App: React.FC = () => {
             role: 'model',
             text: '⚠️ Context limit reached. Continuing in a new chat session.'
           }]);
-        } else if (event.event === 'delta' && event.data.fullText !== undefined) {
-          const cleanedText = event.data.fullText.trim();
-          if (cleanedText || lastFullText) {
-            lastFullText = cleanedText;
+        } else if (event.event === 'delta' && event.data.textDelta !== undefined) {
+          // Deltas carry only new text; accumulate locally
+          streamedText += event.data.textDelta;
+          const cleanedText = streamedText.trim();
+          if (cleanedText) {
             setMessages(prev => {
               const newMessages = [...prev];
               newMessages[newMessages.length - 1].text = cleanedText;
@@ -362,6 +365,9 @@ const App: React.FC = () => {
           }
         } else if (event.event === 'sql' && event.data.sql) {
           setSql(event.data.sql);
+        } else if (event.event === 'sql_delta' && event.data.append) {
+          const append = event.data.append;
+          setSql(prev => prev + append);
         } else if (event.event === 'done') {
           if (event.data.finalText && event.data.finalText.trim()) {
             setMessages(prev => {
@@ -4,11 +4,11 @@ const DEFAULT_BACKEND_URL = 'http://localhost:8005';
 export const BACKEND_URL = (import.meta.env.VITE_BACKEND_URL || DEFAULT_BACKEND_URL).trim();
 
 export interface SSEEvent {
-  event: 'delta' | 'sql' | 'done' | 'error' | 'tool' | 'context' | 'chat_rollover';
+  event: 'delta' | 'sql' | 'sql_delta' | 'done' | 'error' | 'tool' | 'context' | 'chat_rollover';
   data: {
     textDelta?: string;
-    fullText?: string;
     sql?: string;
+    append?: string;
     finalText?: string;
     finalSql?: string;
     message?: string;
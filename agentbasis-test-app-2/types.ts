@@ -21,7 +21,7 @@ export interface Chat {
   title: string | null;
   created_at: string;
   updated_at: string;
-  latest_sql?: string;
+  latest_sql?: string | null;
   context_used_chars?: number;
   context_cap_chars?: number;
   context_usage_pct?: number;
@@ -17,5 +17,11 @@ echo "📡 Server will be available at http://localhost:8005"
 echo "📚 API docs at http://localhost:8005/docs"
 echo ""
 
-# Run with uvicorn
-uvicorn claude_db_agent.api:app --host 0.0.0.0 --port 8005 --reload
+# Run with uvicorn (uvloop + httptools are picked up automatically via uvicorn[standard]).
+# Set UVICORN_WORKERS to run multiple worker processes instead of the dev reloader;
+# each worker has its own DB pool, so size NEON_POOL_MAX per worker.
+if [ -n "$UVICORN_WORKERS" ]; then
+    uvicorn claude_db_agent.api:app --host 0.0.0.0 --port 8005 --workers "$UVICORN_WORKERS"
+else
+    uvicorn claude_db_agent.api:app --host 0.0.0.0 --port 8005 --reload
+fi
@@ -1,22 +1,28 @@
 """FastAPI application for Claude DB Agent."""
 
 import os
-import json
 import re
-from typing import AsyncGenerator, List, Optional, Tuple
+import logging
+import time
+import asyncio
+from typing import AsyncGenerator, Dict, FrozenSet, List, Optional, Set, Tuple
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, Response
+from sse_starlette.sse import EventSourceResponse
 from dotenv import load_dotenv
-from anthropic import Anthropic
+import orjson
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 import httpx
 
 # AgentBasis SDK for AI agent observability
 import agentbasis
 from agentbasis import trace
 from agentbasis.llms.anthropic import instrument as instrument_anthropic
+from opentelemetry import trace as otel_trace
 
 from .api_models import (
     AgentStreamRequest, 
@@ -29,12 +35,27 @@ from .api_models import (
     MemoryQAItem
 )
 from .neon_db import NeonDB
-from .clerk_auth import require_user_id, require_auth_context, AuthContext
+from .sql_tools import (
+    get_compact_sql_context,
+    get_full_sql,
+    get_sql_versions,
+    restore_sql,
+    get_latest_sql,
+    save_new_sql_version,
+    update_chat_timestamp,
+    get_chat_context_usage,
+    update_chat_context_usage,
+    create_chat
+)
+from .clerk_auth import ClerkAuth, require_user_id, require_auth_context, AuthContext
 from .tools_config import get_tool_definitions
+from .supermemory_client import SupermemoryClient
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Tracks whether AgentBasis is successfully initialized in this process.
 AGENTBASIS_ENABLED = False
 
@@ -67,10 +88,8 @@ try:
             print("✓ AgentBasis SDK initialized with Anthropic instrumentation")
     else:
         print("⚠️  Warning: AGENTBASIS_API_KEY or AGENTBASIS_AGENT_ID not set, tracing disabled")
-except Exception as e:
-    import traceback
-    print(f"⚠️  AgentBasis initialization failed: {e}")
-    print(f"⚠️  Traceback: {traceback.format_exc()}")
+except Exception:
+    logger.exception("⚠️  AgentBasis initialization failed")
 
 # System instruction for Claude (matching frontend UX)
 SYSTEM_INSTRUCTION = """You are a world-class database architect and SQL expert specializing in Supabase (PostgreSQL).
@@ -102,6 +121,19 @@ Database Rules:
 6. Use uppercase for SQL keywords.
 7. Include concise comments starting with --."""
 
+# Short prompt for small-talk turns routed to the fast model
+SYSTEM_INSTRUCTION_SIMPLE = """You are a friendly assistant for a Supabase (PostgreSQL) schema designer.
+Reply briefly in plain text. Do not write SQL; invite the user to describe the schema they need."""
+
+AGENT_MODEL = "claude-sonnet-4-20250514"
+FAST_MODEL = "claude-3-5-haiku-20241022"
+
+# Prompt-cache breakpoint: the prefix up to a marked block is reused across calls
+_EPHEMERAL_CACHE = {"type": "ephemeral"}
+# System prompts as cacheable content blocks (they prefix every call)
+_SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_INSTRUCTION, "cache_control": _EPHEMERAL_CACHE}]
+_SYSTEM_BLOCKS_SIMPLE = [{"type": "text", "text": SYSTEM_INSTRUCTION_SIMPLE, "cache_control": _EPHEMERAL_CACHE}]
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -111,18 +143,62 @@ async def lifespan(app: FastAPI):
     if not api_key:
         print("⚠️  Warning: ANTHROPIC_API_KEY not set")
     
+    # Shared Anthropic client; concurrent streams multiplex over pooled HTTP/2 connections
+    app.state.anthropic = AsyncAnthropic(
+        api_key=api_key,
+        timeout=httpx.Timeout(120.0, connect=10.0),  # Longer timeout for tool loops
+        max_retries=2,
+        http_client=DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+    ) if api_key else None
+    
+    # Load balancers probe /health constantly; its body never changes after startup
+    app.state.health_body = orjson.dumps({
+        "status": "ok",
+        "anthropic_configured": app.state.anthropic is not None
+    })
+    
+    # Concurrent agent streams; excess requests wait for a free slot
+    app.state.stream_admission = StreamAdmission(int(os.getenv("MAX_CONCURRENT_STREAMS", "64")))
+    
+    # Shared Supermemory client (None when memory is not configured)
+    supermemory_api_key = os.getenv("SUPERMEMORY_API_KEY")
+    app.state.supermemory = SupermemoryClient(supermemory_api_key) if supermemory_api_key else None
+    
     # Initialize Neon DB connection pool
     database_url = os.getenv("DATABASE_URL")
     if database_url:
-        NeonDB.initialize(database_url)
+        await NeonDB.initialize(
+            database_url,
+            min_conn=int(os.getenv("NEON_POOL_MIN", "4")),
+            max_conn=int(os.getenv("NEON_POOL_MAX", "20")),
+            use_pooler=os.getenv("NEON_USE_POOLER", "1") != "0",
+            acquire_timeout=float(os.getenv("NEON_ACQUIRE_TIMEOUT", "10")),
+            statement_cache_size=int(os.getenv("NEON_STATEMENT_CACHE_SIZE", "100"))
+        )
         print("✓ Neon DB connection pool initialized")
     else:
         print("⚠️  Warning: DATABASE_URL not set, chat persistence disabled")
     
+    # Shared HTTP client for Supabase Management API calls (keep-alive + HTTP/2)
+    app.state.http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+    )
+    
     yield
     
     # Shutdown
-    NeonDB.close_pool()
+    await app.state.http_client.aclose()
+    if app.state.anthropic is not None:
+        await app.state.anthropic.close()
+    if app.state.supermemory is not None:
+        await app.state.supermemory.aclose()
+    await ClerkAuth.aclose()
+    await NeonDB.close_pool()
 
 
 # Create FastAPI app
@@ -130,7 +206,8 @@ app = FastAPI(
     title="Claude DB Agent API",
     description="Backend API for Claude-powered database schema generation",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -145,25 +222,181 @@ app.add_middleware(
 
 
 @app.get("/health")
-def health() -> dict:
-    """Simple health check endpoint."""
-    return {"status": "ok"}
+async def health() -> Response:
+    """Health check endpoint (body is fixed at startup)."""
+    return Response(app.state.health_body, media_type="application/json")
+
+
+class DeltaBatcher:
+    """Coalesce chat text deltas into fewer SSE events.
+
+    The first chat text is released immediately; after each flush that sent
+    text the batch size grows (x3, capped) so long responses send far fewer
+    frames, while the time window bounds how long text can sit unsent.
+    """
+
+    def __init__(self, max_batch: int = 24, max_delay: float = 0.03) -> None:
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._batch_cap = 1
+        self._parts: List[str] = []
+        self._pending = 0  # Chunks received since the last flush
+        self._last_flush = time.monotonic()
+
+    def add(self, text: str) -> None:
+        if text:
+            self._parts.append(text)
+            self._pending += 1
+
+    def bump(self) -> None:
+        """Count a chunk that produced no chat text (e.g. SQL) towards the batch."""
+        self._pending += 1
+
+    @property
+    def pending(self) -> bool:
+        return self._pending > 0
+
+    def time_left(self) -> float:
+        """Seconds until the pending chunks are due to be flushed."""
+        return max(0.0, self.max_delay - (time.monotonic() - self._last_flush))
+
+    def ready(self) -> bool:
+        """Whether the pending chunks should be flushed now."""
+        if not self._pending:
+            return False
+        return (
+            self._pending >= self._batch_cap
+            or time.monotonic() - self._last_flush > self.max_delay
+        )
+
+    def take(self) -> str:
+        """Return and clear the pending text."""
+        if not self._pending:
+            return ""
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        if text:
+            self._batch_cap = min(self.max_batch, self._batch_cap * 3)
+        return text
+
+
+class StreamAdmission:
+    """Cap the number of agent streams running at once.
+
+    Each stream holds an upstream Anthropic connection for its whole duration, so
+    excess streams wait here (their SSE connection kept alive by pings) rather
+    than piling onto the event loop.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.active = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self) -> None:
+        async with self._cond:
+            try:
+                await self._cond.wait_for(lambda: self.active < self.limit)
+            except asyncio.CancelledError:
+                # Before Python 3.13 a waiter cancelled after being notified swallows
+                # the wakeup; hand it on so a free slot isn't left idle
+                if self.active < self.limit:
+                    self._cond.notify(1)
+                raise
+            self.active += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        # Free the slot before awaiting the lock so cancellation can't leak it
+        self.active -= 1
+        async with self._cond:
+            self._cond.notify(1)
+
+
+async def _admitted(admission: StreamAdmission, stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """Run an SSE generator once the admission controller lets it in."""
+    try:
+        async with admission:
+            async for frame in stream:
+                yield frame
+    finally:
+        await stream.aclose()
+
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _spawn_background(coro) -> None:
+    """Run a coroutine in the background without blocking the caller."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+# Total time a handler may spend on its DB / Supabase calls before answering 504.
+# Cancelling on the deadline frees the pool slot instead of letting requests pile up.
+DB_REQUEST_BUDGET_S = 5.0
+SUPABASE_REQUEST_BUDGET_S = 30.0
+
+
+async def with_budget(coro, timeout: float):
+    """Await coro, cancelling it and raising a 504 once timeout seconds have passed."""
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+
+
+@lru_cache(maxsize=None)
+def _sse_prefix(event: str) -> bytes:
+    """The fixed `event:`/`data:` header for an event type, encoded once."""
+    return b"event: " + event.encode() + b"\ndata: "
+
+
+def _sse(event: str, payload: dict) -> bytes:
+    """Encode one Server-Sent Events frame."""
+    return _sse_prefix(event) + orjson.dumps(payload) + b"\n\n"
+
+
+def _context_frame(chat_id: str, used_chars: int, cap_chars: int, usage_pct: Optional[int] = None) -> bytes:
+    """Encode a `context` event."""
+    if usage_pct is None:
+        usage_pct = int((used_chars / cap_chars) * 100) if cap_chars else 0
+    return _sse("context", {
+        'chatId': str(chat_id),
+        'usedChars': used_chars,
+        'capChars': cap_chars,
+        'usagePct': usage_pct
+    })
+
+
+_SQL_COMPLETE_RE = re.compile(r'```sql\s*([\s\S]*?)```', re.IGNORECASE)
+_SQL_INCOMPLETE_RE = re.compile(r'```sql\s*([\s\S]*)', re.IGNORECASE)
+_SQL_TRAILING_RE = re.compile(r'```\s*$')
+_SQL_FENCE_RE = re.compile(r'```sql', re.IGNORECASE)
+_MULTI_NL_RE = re.compile(r'\n\s*\n\s*\n+')
 
 
 def extract_sql_blocks(text: str) -> str:
     """Extract SQL from markdown code blocks (handles complete and incomplete blocks)."""
+    # Cheap substring check before any regex scan (fences are matched case-insensitively)
+    if "```" not in text:
+        return ''
+    
     # Try to find complete SQL block first
-    sql_match = re.search(r'```sql\s*([\s\S]*?)```', text, re.IGNORECASE | re.DOTALL)
+    sql_match = _SQL_COMPLETE_RE.search(text)
     if sql_match:
         return sql_match.group(1).strip()
     
     # If no complete block, check for incomplete block (during streaming)
-    incomplete_match = re.search(r'```sql\s*([\s\S]*)', text, re.IGNORECASE | re.DOTALL)
+    incomplete_match = _SQL_INCOMPLETE_RE.search(text)
     if incomplete_match:
         # Extract everything after ```sql until end of text
         sql_content = incomplete_match.group(1).strip()
         # Remove any trailing markdown if it appears
-        sql_content = re.sub(r'```\s*$', '', sql_content).strip()
+        sql_content = _SQL_TRAILING_RE.sub('', sql_content).strip()
         return sql_content
     
     return ''
@@ -177,143 +410,344 @@ def strip_sql_blocks(text: str) -> str:
     if not text:
         return ''
     
-    # Remove complete SQL blocks (```sql ... ```)
-    text = re.sub(r'```sql\s*[\s\S]*?```', '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Remove incomplete SQL blocks (during streaming: ```sql ... without closing ```)
-    text = re.sub(r'```sql[\s\S]*$', '', text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Remove standalone opening markdown (```sql) if it appears
-    text = re.sub(r'```sql\s*', '', text, flags=re.IGNORECASE)
+    # Without a fence there is nothing to remove; skip straight to whitespace cleanup
+    if "```" in text:
+        # One pass: keep the text between ```sql ... ``` blocks; an unclosed
+        # block (still streaming) runs to the end of the text
+        parts = []
+        pos = 0
+        while True:
+            match = _SQL_FENCE_RE.search(text, pos)
+            if not match:
+                parts.append(text[pos:])
+                break
+            parts.append(text[pos:match.start()])
+            end = text.find("```", match.end())
+            if end == -1:
+                break
+            pos = end + 3
+        text = "".join(parts)
+        # Cutting a block out can join stray backticks into a new fence; drop it too
+        match = _SQL_FENCE_RE.search(text)
+        if match:
+            text = text[:match.start()]
     
     # Clean up any extra whitespace/newlines left behind
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Multiple newlines -> max 2
+    text = _MULTI_NL_RE.sub('\n\n', text)  # Multiple newlines -> max 2
     text = text.strip()
     
     return text
 
 
-def _split_sql_statements(sql_text: str) -> List[str]:
-    """Split SQL into statements, respecting quotes, comments, and dollar-quoted blocks."""
-    statements: List[str] = []
-    buf: List[str] = []
-    i = 0
-    in_single = False
-    in_double = False
-    in_line_comment = False
-    in_block_comment = False
-    dollar_tag: Optional[str] = None
-
-    while i < len(sql_text):
-        ch = sql_text[i]
-        nxt = sql_text[i + 1] if i + 1 < len(sql_text) else ""
-
-        if in_line_comment:
-            buf.append(ch)
-            if ch == "\n":
-                in_line_comment = False
-            i += 1
-            continue
+_SMALL_TALK_RE = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|thx|good (morning|afternoon|evening)|bye|goodbye)\b",
+    re.IGNORECASE
+)
+# Memory references and SQL keywords in one alternation, so a single scan tells
+# whether the message needs context
+_CONTEXT_TRIGGER_RE = re.compile(
+    r"\b(?:"
+    r"(?P<memory>previous|earlier|before|above|last time|as i said|as i mentioned|you said|we discussed|prior)"
+    r"|(?P<sql>sql|schema|database|db|table|column|index|constraint|rls|policy|alter|create|drop|add|remove|modify|change|update|design|build|generate)"
+    r")\b",
+    re.IGNORECASE
+)
 
-        if in_block_comment:
-            buf.append(ch)
-            if ch == "*" and nxt == "/":
-                buf.append(nxt)
-                i += 2
-                in_block_comment = False
-                continue
-            i += 1
-            continue
 
-        if dollar_tag:
-            if sql_text.startswith(dollar_tag, i):
-                buf.append(dollar_tag)
-                i += len(dollar_tag)
-                dollar_tag = None
-                continue
-            buf.append(ch)
-            i += 1
-            continue
+# Messages that usually make the model open with get_sql_context
+_SCHEMA_PREFETCH_RE = re.compile(r"\b(?:schema|tables?|columns?|existing|current)\b", re.IGNORECASE)
 
-        if not in_single and not in_double:
-            if ch == "-" and nxt == "-":
-                in_line_comment = True
-                buf.append(ch)
-                buf.append(nxt)
-                i += 2
-                continue
-            if ch == "/" and nxt == "*":
-                in_block_comment = True
-                buf.append(ch)
-                buf.append(nxt)
-                i += 2
-                continue
-            if ch == "$":
-                end = sql_text.find("$", i + 1)
-                if end != -1:
-                    tag = sql_text[i:end + 1]
-                    if re.fullmatch(r"\$[A-Za-z_][A-Za-z0-9_]*\$", tag) or tag == "$$":
-                        dollar_tag = tag
-                        buf.append(tag)
-                        i = end + 1
-                        continue
-
-        if ch == "'" and not in_double:
-            if in_single and nxt == "'":
-                buf.append(ch)
-                buf.append(nxt)
-                i += 2
-                continue
-            in_single = not in_single
-            buf.append(ch)
-            i += 1
-            continue
 
-        if ch == '"' and not in_single:
-            if in_double and nxt == '"':
-                buf.append(ch)
-                buf.append(nxt)
-                i += 2
-                continue
-            in_double = not in_double
-            buf.append(ch)
-            i += 1
+def is_simple_message(message: str) -> bool:
+    """Whether a message is small talk that needs no schema context or tools.
+
+    Kept deliberately narrow: short answers like "yes" or "ok" may be replies
+    to a clarification question, so only greetings/thanks/goodbyes qualify.
+    """
+    return (
+        len(message) < 160
+        and _SMALL_TALK_RE.match(message) is not None
+        and not _CONTEXT_TRIGGER_RE.search(message)
+    )
+
+
+def _partial_fence_len(text: str, start: int, fence: str) -> int:
+    """Length of the longest suffix of text[start:] that is a proper prefix of fence."""
+    for size in range(min(len(fence) - 1, len(text) - start), 0, -1):
+        if text[-size:].lower() == fence[:size]:
+            return size
+    return 0
+
+
+class SqlBlockSplitter:
+    """Incrementally split streamed text into chat text and SQL.
+
+    Mirrors strip_sql_blocks/extract_sql_blocks over the accumulated text, but
+    each chunk is scanned once instead of re-running the regexes over the whole
+    response on every delta.
+    """
+
+    OPEN_FENCE = "```sql"
+    CLOSE_FENCE = "```"
+
+    def __init__(self) -> None:
+        self.in_sql = False
+        self._pending = ""  # Possible partial fence held back from the last chunk
+        # Chat text right before the open SQL block that could still become part of
+        # an opener: cutting the block out can join it with the text after the block
+        self._hold = ""
+        # Leading chars of _pending that came from _hold (an opener starting there is joined)
+        self._hold_len = 0
+        # A joined opener was found: like strip_sql_blocks, drop the rest of the text
+        self._truncated = False
+        self._blocks_seen = 0
+        self._clean_parts: List[str] = []
+        self._sql_parts: List[str] = []
+        self._sql: Optional[str] = ""
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the new chat text (SQL removed)."""
+        if self._truncated:
+            return ""
+        data = self._pending + chunk
+        hold_len = self._hold_len
+        self._pending = ""
+        self._hold_len = 0
+        clean_delta: List[str] = []
+        pos = 0
+
+        while pos < len(data):
+            if self.in_sql:
+                end = data.find(self.CLOSE_FENCE, pos)
+                if end == -1:
+                    keep = _partial_fence_len(data, pos, self.CLOSE_FENCE)
+                    self._add_sql(data[pos:len(data) - keep])
+                    self._pending = data[len(data) - keep:]
+                    break
+                self._add_sql(data[pos:end])
+                self.in_sql = False
+                # Scan the held text again, now followed by the text after the block
+                data = self._hold + data[end + len(self.CLOSE_FENCE):]
+                hold_len = len(self._hold)
+                self._hold = ""
+                pos = 0
+            else:
+                match = _SQL_FENCE_RE.search(data, pos)
+                if match and match.start() < hold_len:
+                    # Opener joined across a removed block
+                    clean_delta.append(data[pos:match.start()])
+                    self._truncated = True
+                    break
+                if not match:
+                    keep = _partial_fence_len(data, pos, self.OPEN_FENCE)
+                    # Backticks right before a partial opener could end up in _hold too
+                    while keep and len(data) - keep > pos and data[len(data) - keep - 1] == "`":
+                        keep += 1
+                    clean_delta.append(data[pos:len(data) - keep])
+                    self._pending = data[len(data) - keep:]
+                    self._hold_len = max(0, hold_len - (len(data) - keep))
+                    break
+                # Hold back any trailing opener prefix until the block closes
+                clean = "".join(clean_delta) + data[pos:match.start()]
+                held = _partial_fence_len(clean, 0, self.OPEN_FENCE)
+                clean_delta = [clean[:len(clean) - held]]
+                self._hold = clean[len(clean) - held:]
+                self.in_sql = True
+                self._blocks_seen += 1
+                hold_len = 0
+                pos = match.end()
+
+        delta = "".join(clean_delta)
+        if delta:
+            self._clean_parts.append(delta)
+        return delta
+
+    def flush(self) -> str:
+        """Release held-back text once the stream has ended."""
+        pending, self._pending = self._pending, ""
+        if self._truncated:
+            return ""
+        if self.in_sql:
+            # Unclosed block: the SQL runs to the end; text held before it is chat text
+            self._add_sql(pending)
+            pending, self._hold = self._hold, ""
+        if not pending:
+            return ""
+        self._clean_parts.append(pending)
+        return pending
+
+    def _add_sql(self, text: str) -> None:
+        # Like extract_sql_blocks, only the first SQL block is surfaced.
+        if text and self._blocks_seen == 1:
+            self._sql_parts.append(text)
+            self._sql = None
+
+    @property
+    def clean_text(self) -> str:
+        """Chat text seen so far, normalized like strip_sql_blocks."""
+        return _MULTI_NL_RE.sub('\n\n', "".join(self._clean_parts)).strip()
+
+    @property
+    def sql(self) -> str:
+        """SQL from the first code block seen so far."""
+        if self._sql is None:
+            self._sql = "".join(self._sql_parts).strip()
+        return self._sql
+
+
+# Tokens that can change splitting state: comment openers, quotes, dollar-quote tags, and ';'
+_SQL_TOKEN_RE = re.compile(r"--|/\*|'|\"|;|\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
+
+
+def _find_quote_end(sql_text: str, quote: str, pos: int) -> int:
+    """Index just past the closing quote (doubled quotes are escapes), or -1."""
+    while True:
+        end = sql_text.find(quote, pos)
+        if end == -1:
+            return -1
+        if sql_text.startswith(quote, end + 1):
+            pos = end + 2
             continue
+        return end + 1
+
+
+def _split_sql_statements(sql_text: str) -> List[str]:
+    """Split SQL into statements, respecting quotes, comments, and dollar-quoted blocks.
 
-        if ch == ";" and not in_single and not in_double:
-            statement = "".join(buf).strip()
+    The regex only locates tokens that matter for splitting; the bodies of
+    comments, quoted strings and dollar-quoted blocks are skipped with str.find.
+    Statements come back stripped, without trailing semicolons.
+    """
+    statements: List[str] = []
+    stmt_start = 0
+    pos = 0
+    length = len(sql_text)
+
+    while pos < length:
+        match = _SQL_TOKEN_RE.search(sql_text, pos)
+        if not match:
+            break
+        token = match.group()
+        token_end = match.end()
+
+        if token == ";":
+            statement = sql_text[stmt_start:match.start()].strip()
             if statement:
+                # Only a trailing comment or unterminated quote can end in ';'
+                if statement[-1] == ";":
+                    statement = statement.rstrip(";").strip()
                 statements.append(statement)
-            buf = []
-            i += 1
+            stmt_start = pos = token_end
             continue
 
-        buf.append(ch)
-        i += 1
+        if token == "--":
+            end = sql_text.find("\n", token_end)
+            pos = end + 1 if end != -1 else length
+        elif token == "/*":
+            end = sql_text.find("*/", token_end)
+            pos = end + 2 if end != -1 else length
+        elif token == "'" or token == '"':
+            end = _find_quote_end(sql_text, token, token_end)
+            pos = end if end != -1 else length
+        else:
+            # Dollar-quoted block: skip to the matching closing tag
+            end = sql_text.find(token, token_end)
+            pos = end + len(token) if end != -1 else length
 
-    tail = "".join(buf).strip()
+    tail = sql_text[stmt_start:].strip()
     if tail:
+        if tail[-1] == ";":
+            tail = tail.rstrip(";").strip()
         statements.append(tail)
 
     return statements
 
 
+@lru_cache(maxsize=4096)
 def _normalize_object_name(name: str) -> str:
     cleaned = name.strip().strip('"')
     parts = [part.strip().strip('"') for part in cleaned.split(".")]
     return ".".join(part.lower() for part in parts if part)
 
 
-def _get_object_key(statement: str) -> Optional[Tuple[str, str]]:
-    patterns = [
+_OBJECT_KEY_PATTERNS = [
+    (kind, re.compile(pattern, re.IGNORECASE))
+    for kind, pattern in [
         ("TABLE", r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([A-Za-z0-9_\".]+)"),
         ("VIEW", r"CREATE\s+(?:OR\s+REPLACE\s+)?VIEW\s+([A-Za-z0-9_\".]+)"),
         ("FUNCTION", r"CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+([A-Za-z0-9_\".]+)"),
         ("TYPE", r"CREATE\s+TYPE\s+([A-Za-z0-9_\".]+)"),
         ("INDEX", r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?([A-Za-z0-9_\".]+)"),
     ]
-    for kind, pattern in patterns:
-        match = re.search(pattern, statement, flags=re.IGNORECASE)
+]
+_DROP_TABLE_RE = re.compile(r"DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?([A-Za-z0-9_\".]+)", re.IGNORECASE)
+_INSERT_TABLE_RE = re.compile(r"INSERT\s+INTO\s+([A-Za-z0-9_\".]+)", re.IGNORECASE)
+_TABLE_REF_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE | re.DOTALL)
+    for pattern in [
+        r"INSERT\s+INTO\s+([A-Za-z0-9_\".]+)",
+        r"UPDATE\s+([A-Za-z0-9_\".]+)",
+        r"DELETE\s+FROM\s+([A-Za-z0-9_\".]+)",
+        r"ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?([A-Za-z0-9_\".]+)",
+        r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?[A-Za-z0-9_\".]+\s+ON\s+(?:ONLY\s+)?([A-Za-z0-9_\".]+)",
+        r"CREATE\s+TRIGGER\s+[A-Za-z0-9_\".]+\s+.*\s+ON\s+([A-Za-z0-9_\".]+)",
+        r"CREATE\s+POLICY\s+[A-Za-z0-9_\".]+\s+ON\s+([A-Za-z0-9_\".]+)",
+        r"COMMENT\s+ON\s+TABLE\s+([A-Za-z0-9_\".]+)",
+        r"GRANT\s+.*\s+ON\s+TABLE\s+([A-Za-z0-9_\".]+)",
+        r"REVOKE\s+.*\s+ON\s+TABLE\s+([A-Za-z0-9_\".]+)",
+        r"TRUNCATE\s+TABLE\s+(?:ONLY\s+)?([A-Za-z0-9_\".]+)",
+        r"DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?([A-Za-z0-9_\".]+)",
+    ]
+]
+
+
+def _compile_prefix_filter(prefixes: List[str]) -> "re.Pattern[str]":
+    """One alternation of pattern prefixes; group N matches iff prefix N-1 does."""
+    return re.compile("|".join(f"({prefix})" for prefix in prefixes), re.IGNORECASE)
+
+
+def _candidate_patterns(prefix_re: "re.Pattern[str]", statement: str) -> Set[int]:
+    """Indexes of the patterns whose prefix occurs in the statement (single scan)."""
+    return {match.lastindex - 1 for match in prefix_re.finditer(statement)}
+
+
+# Leading keywords of each pattern above, in the same order. A full pattern can
+# only match where its prefix does, so one pass over the statement picks the few
+# patterns worth running instead of searching with every one of them.
+_OBJECT_KEY_PREFIX_RE = _compile_prefix_filter([
+    r"CREATE\s+TABLE\s",
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?VIEW\s",
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s",
+    r"CREATE\s+TYPE\s",
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s",
+])
+_TABLE_REF_PREFIX_RE = _compile_prefix_filter([
+    r"INSERT\s+INTO\s",
+    r"UPDATE\s",
+    r"DELETE\s+FROM\s",
+    r"ALTER\s+TABLE\s",
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s",
+    r"CREATE\s+TRIGGER\s",
+    r"CREATE\s+POLICY\s",
+    r"COMMENT\s+ON\s+TABLE\s",
+    r"GRANT\s",
+    r"REVOKE\s",
+    r"TRUNCATE\s+TABLE\s",
+    r"DROP\s+TABLE\s",
+])
+
+
+# The chat's existing schema is re-merged on every turn, so the same statements
+# come through here again and again
+@lru_cache(maxsize=4096)
+def _get_object_key(statement: str) -> Optional[Tuple[str, str]]:
+    candidates = _candidate_patterns(_OBJECT_KEY_PREFIX_RE, statement)
+    if not candidates:
+        return None
+    # Keep the pattern priority order: the first kind that matches wins
+    for idx in sorted(candidates):
+        kind, pattern = _OBJECT_KEY_PATTERNS[idx]
+        match = pattern.search(statement)
         if match:
             name = match.group(1)
             return kind, _normalize_object_name(name)
@@ -321,11 +755,7 @@ def _get_object_key(statement: str) -> Optional[Tuple[str, str]]:
 
 
 def _get_drop_table_key(statement: str) -> Optional[Tuple[str, str]]:
-    match = re.search(
-        r"DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?([A-Za-z0-9_\".]+)",
-        statement,
-        flags=re.IGNORECASE
-    )
+    match = _DROP_TABLE_RE.search(statement)
     if not match:
         return None
     name = match.group(1)
@@ -333,39 +763,23 @@ def _get_drop_table_key(statement: str) -> Optional[Tuple[str, str]]:
 
 
 def _get_insert_table_key(statement: str) -> Optional[Tuple[str, str]]:
-    match = re.search(
-        r"INSERT\s+INTO\s+([A-Za-z0-9_\".]+)",
-        statement,
-        flags=re.IGNORECASE
-    )
+    match = _INSERT_TABLE_RE.search(statement)
     if not match:
         return None
     name = match.group(1)
     return "TABLE", _normalize_object_name(name)
 
 
-def _get_statement_table_refs(statement: str) -> set[Tuple[str, str]]:
+# Cached like _get_object_key; frozenset so a cached result can't be mutated
+@lru_cache(maxsize=4096)
+def _get_statement_table_refs(statement: str) -> FrozenSet[Tuple[str, str]]:
     refs: set[Tuple[str, str]] = set()
-    patterns = [
-        r"INSERT\s+INTO\s+([A-Za-z0-9_\".]+)",
-        r"UPDATE\s+([A-Za-z0-9_\".]+)",
-        r"DELETE\s+FROM\s+([A-Za-z0-9_\".]+)",
-        r"ALTER\s+TABLE\s+(?:IF\s+EXISTS\s+)?([A-Za-z0-9_\".]+)",
-        r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?[A-Za-z0-9_\".]+\s+ON\s+(?:ONLY\s+)?([A-Za-z0-9_\".]+)",
-        r"CREATE\s+TRIGGER\s+[A-Za-z0-9_\".]+\s+.*\s+ON\s+([A-Za-z0-9_\".]+)",
-        r"CREATE\s+POLICY\s+[A-Za-z0-9_\".]+\s+ON\s+([A-Za-z0-9_\".]+)",
-        r"COMMENT\s+ON\s+TABLE\s+([A-Za-z0-9_\".]+)",
-        r"GRANT\s+.*\s+ON\s+TABLE\s+([A-Za-z0-9_\".]+)",
-        r"REVOKE\s+.*\s+ON\s+TABLE\s+([A-Za-z0-9_\".]+)",
-        r"TRUNCATE\s+TABLE\s+(?:ONLY\s+)?([A-Za-z0-9_\".]+)",
-        r"DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?([A-Za-z0-9_\".]+)",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, statement, flags=re.IGNORECASE | re.DOTALL)
+    for idx in _candidate_patterns(_TABLE_REF_PREFIX_RE, statement):
+        match = _TABLE_REF_PATTERNS[idx].search(statement)
         if match:
             name = match.group(1)
             refs.add(("TABLE", _normalize_object_name(name)))
-    return refs
+    return frozenset(refs)
 
 
 def merge_sql_patch(existing_sql: str, patch_sql: str) -> str:
@@ -386,43 +800,106 @@ def merge_sql_patch(existing_sql: str, patch_sql: str) -> str:
         if key:
             existing_index[key] = idx
 
-    additions: list[str] = []
+    # Table refs per existing statement plus the reverse index (table -> statement
+    # positions). Built on the first DROP and kept in sync as statements are
+    # replaced or dropped, so each DROP is a lookup instead of a full re-parse.
+    existing_refs: list[FrozenSet[Tuple[str, str]]] = []
+    ref_index: dict[tuple[str, str], set[int]] = {}
+
+    def build_ref_index() -> None:
+        for idx, stmt in enumerate(existing_statements):
+            refs = _get_statement_table_refs(stmt) if stmt else frozenset()
+            existing_refs.append(refs)
+            for ref in refs:
+                ref_index.setdefault(ref, set()).add(idx)
+
+    def set_existing(idx: int, statement: str) -> None:
+        existing_statements[idx] = statement
+        if not existing_refs:
+            return
+        for ref in existing_refs[idx]:
+            ref_index[ref].discard(idx)
+        existing_refs[idx] = _get_statement_table_refs(statement) if statement else frozenset()
+        for ref in existing_refs[idx]:
+            ref_index.setdefault(ref, set()).add(idx)
+
+    additions: list[tuple[str, Optional[Tuple[str, str]]]] = []  # (statement, drop key)
     dropped_table_keys: set[Tuple[str, str]] = set()
     for statement in patch_statements:
         drop_key = _get_drop_table_key(statement)
         if drop_key:
-            removed_any = False
-            for idx, existing_stmt in enumerate(existing_statements):
-                refs = _get_statement_table_refs(existing_stmt)
-                if drop_key in refs:
-                    existing_statements[idx] = ""
-                    removed_any = True
+            if not existing_refs:
+                build_ref_index()
+            matching = list(ref_index.get(drop_key, ()))
+            for idx in matching:
+                set_existing(idx, "")
             dropped_table_keys.add(drop_key)
-            if not removed_any:
-                additions.append(statement)
+            if not matching:
+                additions.append((statement, drop_key))
             continue
         key = _get_object_key(statement)
         if key and key in existing_index:
-            existing_statements[existing_index[key]] = statement
+            set_existing(existing_index[key], statement)
         else:
             if key and key in dropped_table_keys:
-                additions = [
-                    stmt for stmt in additions
-                    if _get_drop_table_key(stmt) != key
-                ]
+                additions = [item for item in additions if item[1] != key]
                 dropped_table_keys.discard(key)
             refs = _get_statement_table_refs(statement)
             if refs.intersection(dropped_table_keys):
                 continue
-            additions.append(statement)
+            additions.append((statement, None))
 
-    merged_statements = [stmt for stmt in existing_statements if stmt.strip()]
-    merged_statements.extend(stmt for stmt in additions if stmt.strip())
+    # Statements are already trimmed by _split_sql_statements; dropped ones are ""
+    merged_statements = [stmt for stmt in existing_statements if stmt]
+    merged_statements.extend(stmt for stmt, _ in additions if stmt)
 
     if not merged_statements:
         return ""
 
-    return ";\n\n".join(stmt.rstrip(";").strip() for stmt in merged_statements) + ";\n"
+    return ";\n\n".join(merged_statements) + ";\n"
+
+
+# (chat_id, user_id, tool name, normalized query) -> (expires at, result) for the memory
+# search tools. Claude often repeats a search within a turn and on quick follow-ups,
+# frequently differing only in case or spacing; writes to the chat's memory drop its
+# entries. Schema reads are already cached per SQL version in sql_tools.
+_SEARCH_TOOL_TTL_SECONDS = 60.0
+_SEARCH_TOOL_CACHE_MAX = 2048
+_search_tool_cache: Dict[Tuple[str, str, str, str], Tuple[float, str]] = {}
+
+
+def _search_cache_key(chat_id: str, user_id: str, tool_name: str, query: str) -> Tuple[str, str, str, str]:
+    return (chat_id, user_id, tool_name, " ".join(query.lower().split()))
+
+
+def _get_cached_search(key: Tuple[str, str, str, str]) -> Optional[str]:
+    cached = _search_tool_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def _cache_search(key: Tuple[str, str, str, str], result: str) -> str:
+    if key not in _search_tool_cache and len(_search_tool_cache) >= _SEARCH_TOOL_CACHE_MAX:
+        _search_tool_cache.pop(next(iter(_search_tool_cache)))
+    _search_tool_cache[key] = (time.monotonic() + _SEARCH_TOOL_TTL_SECONDS, result)
+    return result
+
+
+def _invalidate_search_cache(chat_id: str) -> None:
+    for key in [key for key in _search_tool_cache if key[0] == chat_id]:
+        del _search_tool_cache[key]
+
+
+def _discard_prefetch(task: "asyncio.Task[str]") -> None:
+    """Cancel a prefetch nobody will await.
+    
+    Its outcome is still retrieved once it settles, so a prefetch that fails while
+    being cancelled isn't logged as "Task exception was never retrieved" when it
+    is garbage collected.
+    """
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
 
 @trace
@@ -430,26 +907,21 @@ async def execute_tool(
     tool_name: str,
     tool_input: dict,
     chat_id: str,
-    user_id: str
+    user_id: str,
+    prefetched: Optional[Dict[str, "asyncio.Task[str]"]] = None
 ) -> str:
     """Execute a tool and return the result as a string.
     
     This function handles all tool calls from Claude's tool_use blocks.
+    prefetched maps tool names to results already being fetched for this turn;
+    each is used once.
     """
-    from .sql_tools import (
-        get_compact_sql_context,
-        get_full_sql,
-        get_sql_versions,
-        restore_sql
-    )
-    from .supermemory_client import SupermemoryClient
-    import os
-    
-    supermemory_api_key = os.getenv("SUPERMEMORY_API_KEY")
+    sm_client = app.state.supermemory
     
     try:
         if tool_name == "get_sql_context":
-            result = await get_compact_sql_context(chat_id)
+            task = prefetched.pop(tool_name, None) if prefetched else None
+            result = await (task if task is not None else get_compact_sql_context(chat_id))
             return result if result else "No SQL schema defined yet for this chat."
         
         elif tool_name == "get_full_sql":
@@ -461,31 +933,40 @@ async def execute_tool(
             if not query:
                 return "Error: query parameter is required for search_memory"
             
-            if not supermemory_api_key:
+            if sm_client is None:
                 return "Memory search unavailable: Supermemory not configured."
             
-            sm_client = SupermemoryClient(supermemory_api_key)
+            cache_key = _search_cache_key(chat_id, user_id, tool_name, query)
+            cached = _get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+            
             chunks = await sm_client.search_chat_memory(
                 chat_id, user_id, query, limit=3, max_chars=4000
             )
             
+            # Failed searches also come back empty, so only hits are cached
             if chunks:
-                return "\n\n---\n\n".join(chunks)
+                return _cache_search(cache_key, "\n\n---\n\n".join(chunks))
             return "No relevant memory found for this query."
         
         elif tool_name == "search_clarifications":
             query = tool_input.get("query", "Q:")
             
-            if not supermemory_api_key:
+            if sm_client is None:
                 return "Clarification search unavailable: Supermemory not configured."
             
-            sm_client = SupermemoryClient(supermemory_api_key)
+            cache_key = _search_cache_key(chat_id, user_id, tool_name, query)
+            cached = _get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+            
             chunks = await sm_client.search_chat_qa(
                 chat_id, user_id, query=query, limit=5, max_chars=3000
             )
             
             if chunks:
-                return "\n\n---\n\n".join(chunks)
+                return _cache_search(cache_key, "\n\n---\n\n".join(chunks))
             return "No clarifications saved for this chat yet."
         
         elif tool_name == "get_sql_versions":
@@ -512,6 +993,11 @@ async def execute_tool(
             if version_index not in [0, 1]:
                 return "Error: version_index must be 0 or 1"
             
+            # A prefetched schema summary would describe the SQL before the restore
+            if prefetched:
+                for task in prefetched.values():
+                    _discard_prefetch(task)
+                prefetched.clear()
             restored_sql = await restore_sql(chat_id, version_index)
             preview = restored_sql[:300] + "..." if len(restored_sql) > 300 else restored_sql
             return f"Successfully restored SQL version {version_index}.\n\nRestored SQL preview:\n```sql\n{preview}\n```"
@@ -520,9 +1006,7 @@ async def execute_tool(
             return f"Unknown tool: {tool_name}"
     
     except Exception as e:
-        import traceback
-        print(f"⚠️  Tool execution error ({tool_name}): {e}")
-        print(f"⚠️  Traceback: {traceback.format_exc()}")
+        logger.exception("⚠️  Tool execution error (%s)", tool_name)
         return f"Error executing tool {tool_name}: {str(e)}"
 
 
@@ -530,22 +1014,12 @@ async def generate_sse_stream(
     request: AgentStreamRequest,
     user_id: str,
     session_id: Optional[str] = None,
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[bytes, None]:
     """Generate SSE events from Claude streaming response with native Anthropic tool calling.
     
     This implementation uses Claude's native tool calling capability, allowing the model
     to autonomously decide when to use tools like get_sql_context, search_memory, etc.
     """
-    from .sql_tools import (
-        get_latest_sql,
-        save_new_sql_version,
-        update_chat_timestamp,
-        get_chat_context_usage,
-        update_chat_context_usage
-    )
-    from .supermemory_client import SupermemoryClient
-    from opentelemetry import trace as otel_trace
-    
     # Set AgentBasis context for per-user/session tracing
     try:
         agentbasis.set_user(user_id)
@@ -557,29 +1031,42 @@ async def generate_sse_stream(
     except Exception:
         pass  # Silently ignore if AgentBasis is not initialized
     
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        yield f"event: error\ndata: {json.dumps({'message': 'ANTHROPIC_API_KEY not configured'})}\n\n"
+    # Created at startup only when ANTHROPIC_API_KEY is set
+    if app.state.anthropic is None:
+        yield _sse("error", {'message': 'ANTHROPIC_API_KEY not configured'})
         return
     
     chat_id = request.chat_id
     
+    sm_client = app.state.supermemory
+    
     # Send initial context event from persisted DB values
-    supermemory_api_key = os.getenv("SUPERMEMORY_API_KEY")
-    persisted_context = await get_chat_context_usage(chat_id)
-    if not persisted_context:
-        await update_chat_context_usage(chat_id, 0, 40000)
-        persisted_context = await get_chat_context_usage(chat_id)
-    persisted_used = persisted_context["usedChars"] if persisted_context else 0
-    persisted_cap = persisted_context["capChars"] if persisted_context else 40000
-
-    context_data = {
-        'chatId': str(chat_id),
-        'usedChars': persisted_used,
-        'capChars': persisted_cap,
-        'usagePct': int((persisted_used / persisted_cap) * 100) if persisted_cap else 0
-    }
-    yield f"event: context\ndata: {json.dumps(context_data)}\n\n"
+    # Independent round-trips: fetch context usage and latest SQL concurrently
+    # (latest SQL is used after the response for merging)
+    # Small talk is routed to the fast model without tools, so it never touches the SQL
+    simple = is_simple_message(request.message)
+    # The usage read is also the ownership check (no separate round-trip)
+    if simple:
+        persisted_context = await get_chat_context_usage(chat_id, user_id)
+        latest_sql_text = ""
+    else:
+        persisted_context, latest_sql_text = await asyncio.gather(
+            get_chat_context_usage(chat_id, user_id),
+            get_latest_sql(chat_id)
+        )
+    # Usage defaults are applied in SQL, so None means the chat is missing or not the user's
+    if persisted_context is None:
+        yield _sse("error", {'message': 'Chat not found'})
+        return
+    persisted_used = persisted_context["usedChars"]
+    persisted_cap = persisted_context["capChars"]
+
+    yield _context_frame(chat_id, persisted_used, persisted_cap)
+    
+    # Speculatively fetch the schema summary while the first model call is in flight
+    prefetched: Dict[str, "asyncio.Task[str]"] = {}
+    if not simple and _SCHEMA_PREFETCH_RE.search(request.message):
+        prefetched["get_sql_context"] = asyncio.create_task(get_compact_sql_context(chat_id))
     
     tracer = otel_trace.get_tracer("claude_db_agent.streaming")
     try:
@@ -594,119 +1081,194 @@ async def generate_sse_stream(
             stream_span.set_attribute("agentbasis.conversation.id", str(request.chat_id))
             stream_span.set_attribute("chat.id", str(request.chat_id))
 
-            # Fetch latest SQL for comparison (used after response for merging)
-            latest_sql_text = await get_latest_sql(chat_id)
-            
-            # Initialize Anthropic client
-            client = Anthropic(
-                api_key=api_key,
-                timeout=httpx.Timeout(120.0, connect=10.0),  # Longer timeout for tool loops
-                max_retries=2
-            )
+            # Reuse the process-wide Anthropic client
+            client = app.state.anthropic
             
             # Build initial messages - just the user message, Claude will use tools as needed
             messages = [{"role": "user", "content": request.message}]
             
-            # Get tool definitions
-            tools = get_tool_definitions()
+            # Model, prompt and tool definitions for this turn
+            if simple:
+                model_params = {
+                    "model": FAST_MODEL,
+                    "max_tokens": 1024,
+                    "system": _SYSTEM_BLOCKS_SIMPLE,
+                }
+            else:
+                model_params = {
+                    "model": AGENT_MODEL,
+                    "max_tokens": 8192,
+                    "system": _SYSTEM_BLOCKS,
+                    "tools": get_tool_definitions(),
+                }
+            stream_span.set_attribute("llm.model", model_params["model"])
             
             # Tool calling loop - Claude decides when to use tools
             max_tool_rounds = 5  # Prevent infinite loops
             tool_round = 0
-            full_response = ""
+            splitter = SqlBlockSplitter()
+            batcher = DeltaBatcher()
+            # Local bindings for calls made on every text chunk
+            feed_text, add_delta, sse = splitter.feed, batcher.add, _sse
+            last_sql = ""
             memory_context_str = ""  # Track for summary updates
+            cached_tool_result = None  # Message block carrying the transcript cache breakpoint
+            
+            def flush_frames() -> bytes:
+                """Encode the batched chat text and, if it changed, the SQL."""
+                nonlocal last_sql
+                frames = b""
+                text_delta = batcher.take()
+                if text_delta:
+                    frames += sse("delta", {'textDelta': text_delta})
+                # Small talk never loaded the chat's SQL, so SQL it writes isn't surfaced
+                current_sql = "" if simple else splitter.sql
+                if current_sql and current_sql != last_sql:
+                    # SQL usually just grows while it streams: send only the new suffix
+                    if last_sql and current_sql.startswith(last_sql):
+                        frames += sse("sql_delta", {'append': current_sql[len(last_sql):]})
+                    else:
+                        frames += sse("sql", {'sql': current_sql})
+                    last_sql = current_sql
+                return frames
             
             while tool_round < max_tool_rounds:
                 tool_round += 1
                 print(f"🤖 Anthropic API call (round {tool_round}) with tools...")
                 
-                # Make API call with tools
-                response = client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=8192,
-                    system=SYSTEM_INSTRUCTION,
+                # Stream the API call with tools, token by token
+                async with client.messages.stream(
                     messages=messages,
-                    tools=tools,
-                    temperature=0.3
-                )
+                    temperature=0.3,
+                    **model_params
+                ) as stream:
+                    text_iter = stream.text_stream.__aiter__()
+                    next_text = None
+                    try:
+                        while True:
+                            # With text pending, wait for the next chunk only until the
+                            # batch window closes, so a pause in the stream (e.g. while
+                            # the model writes a tool call) doesn't hold text back
+                            if batcher.pending:
+                                if next_text is None:
+                                    next_text = asyncio.ensure_future(text_iter.__anext__())
+                                done, _ = await asyncio.wait((next_text,), timeout=batcher.time_left())
+                                if not done:
+                                    frames = flush_frames()
+                                    if frames:
+                                        yield frames
+                                    continue
+                            try:
+                                text = await (next_text if next_text is not None else text_iter.__anext__())
+                            except StopAsyncIteration:
+                                break
+                            next_text = None
+                            
+                            # Split only the new text into chat text and SQL
+                            clean_delta = feed_text(text)
+                            if clean_delta:
+                                add_delta(clean_delta)
+                            else:
+                                batcher.bump()
+                            if batcher.ready():
+                                # Text (without SQL blocks) to chat, then the SQL if it changed
+                                frames = flush_frames()
+                                if frames:
+                                    yield frames
+                    finally:
+                        if next_text is not None and not next_text.done():
+                            next_text.cancel()
+                    
+                    response = await stream.get_final_message()
                 
-                # Process response content blocks
-                tool_uses = []
-                text_content = ""
+                usage = response.usage
+                logger.info(
+                    "Round %d tokens: input=%s cache_read=%s cache_write=%s output=%s",
+                    tool_round,
+                    usage.input_tokens,
+                    getattr(usage, "cache_read_input_tokens", None),
+                    getattr(usage, "cache_creation_input_tokens", None),
+                    usage.output_tokens
+                )
                 
-                for block in response.content:
-                    if block.type == "text":
-                        text_content += block.text
-                    elif block.type == "tool_use":
-                        tool_uses.append(block)
+                # Flush any batched text/SQL before tool events or the end of the turn
+                frames = flush_frames()
+                if frames:
+                    yield frames
                 
-                # If there's text content, stream it to the client
-                if text_content:
-                    full_response += text_content
-                    
-                    # Extract SQL and send sql event
-                    current_sql = extract_sql_blocks(full_response)
-                    if current_sql:
-                        yield f"event: sql\ndata: {json.dumps({'sql': current_sql})}\n\n"
-                    
-                    # Send text (without SQL blocks) to chat
-                    clean_text = strip_sql_blocks(full_response)
-                    text_delta = strip_sql_blocks(text_content)
-                    
-                    if text_delta:
-                        yield f"event: delta\ndata: {json.dumps({'textDelta': text_delta, 'fullText': clean_text})}\n\n"
+                tool_uses = [block for block in response.content if block.type == "tool_use"]
                 
                 # If no tool calls, we're done
                 if not tool_uses or response.stop_reason == "end_turn":
                     print(f"✅ Round {tool_round} complete, no more tool calls.")
                     break
                 
-                # Process tool calls
+                # Process tool calls: notify the frontend, then run them concurrently
+                # (execute_tool turns failures into error strings, so gather won't raise)
+                tool_inputs = [getattr(tool_use, 'input', None) or {} for tool_use in tool_uses]
+                yield b"".join(
+                    _sse("tool", {'name': tool_use.name, 'status': 'start', 'input': tool_input})
+                    for tool_use, tool_input in zip(tool_uses, tool_inputs)
+                )
+                results = await asyncio.gather(*(
+                    execute_tool(tool_use.name, tool_input, chat_id, user_id, prefetched)
+                    for tool_use, tool_input in zip(tool_uses, tool_inputs)
+                ))
+                
                 tool_results = []
-                for tool_use in tool_uses:
-                    tool_name = tool_use.name
-                    tool_input = tool_use.input if hasattr(tool_use, 'input') else {}
-                    tool_id = tool_use.id
-                    
-                    # Notify frontend about tool execution
-                    yield f"event: tool\ndata: {json.dumps({'name': tool_name, 'status': 'start', 'input': tool_input})}\n\n"
-                    
-                    # Execute the tool
-                    result = await execute_tool(tool_name, tool_input, chat_id, user_id)
-                    
+                done_frames = b""
+                for tool_use, result in zip(tool_uses, results):
                     # Track memory context for summary updates
-                    if tool_name == "search_memory" and result and "No relevant memory" not in result:
+                    if tool_use.name == "search_memory" and result and "No relevant memory" not in result:
                         memory_context_str = result
                     
-                    yield f"event: tool\ndata: {json.dumps({'name': tool_name, 'status': 'done'})}\n\n"
-                    
+                    done_frames += _sse("tool", {'name': tool_use.name, 'status': 'done'})
                     tool_results.append({
                         "type": "tool_result",
-                        "tool_use_id": tool_id,
+                        "tool_use_id": tool_use.id,
                         "content": result
                     })
+                yield done_frames
+                
+                # Move the cache breakpoint to the newest tool result so the next round
+                # reuses the transcript so far (at most 4 breakpoints per request)
+                if cached_tool_result is not None:
+                    cached_tool_result.pop("cache_control", None)
+                cached_tool_result = tool_results[-1]
+                cached_tool_result["cache_control"] = _EPHEMERAL_CACHE
                 
                 # Add assistant response and tool results to messages for next round
                 messages.append({"role": "assistant", "content": response.content})
                 messages.append({"role": "user", "content": tool_results})
             
-            # Send final event
-            final_text = strip_sql_blocks(full_response)
-            final_sql = extract_sql_blocks(full_response)
-            merged_sql = merge_sql_patch(latest_sql_text, final_sql)
-            yield f"event: done\ndata: {json.dumps({'finalText': final_text, 'finalSql': merged_sql})}\n\n"
+            # Send final event (text and SQL were already split while streaming)
+            splitter.flush()
+            final_text = splitter.clean_text
+            # Small talk ran against an empty latest_sql_text: merging or saving its SQL
+            # would replace the chat's schema, so it only bumps the timestamp below
+            final_sql = "" if simple else splitter.sql
+            latest_stripped = latest_sql_text.strip()
+            sql_changed = bool(final_sql) and final_sql.strip() != latest_stripped
+            if not final_sql:
+                # No SQL this turn (e.g. a clarifying question): what merge would return
+                merged_sql = latest_stripped
+            elif not sql_changed:
+                merged_sql = latest_sql_text
+            else:
+                # CPU-bound on large schemas; run it off the event loop so other streams keep flowing
+                merged_sql = await asyncio.to_thread(merge_sql_patch, latest_sql_text, final_sql)
+            yield _sse("done", {'finalText': final_text, 'finalSql': merged_sql})
             
-            # Persist: Save new SQL version if changed
-            if final_sql and final_sql.strip() != latest_sql_text.strip():
+            # Persist: save the new SQL version if changed (which also bumps the chat
+            # timestamp), otherwise just bump the timestamp
+            if sql_changed:
                 await save_new_sql_version(chat_id, merged_sql)
-            
-            # Update chat timestamp
-            await update_chat_timestamp(chat_id)
+            else:
+                await update_chat_timestamp(chat_id)
             
             # Update Supermemory summary (best-effort)
-            if supermemory_api_key:
+            if sm_client is not None:
                 try:
-                    sm_client = SupermemoryClient(supermemory_api_key)
                     # Build simple rolling summary: user message + assistant response
                     new_summary_chunk = f"User: {request.message}\nAssistant: {final_text}\n\n"
                     
@@ -716,26 +1278,16 @@ async def generate_sse_stream(
                     would_exceed = (base_used + len(new_summary_chunk)) > sm_client.CONTEXT_CAP_CHARS
                     
                     if would_exceed:
-                        # Create new chat and signal rollover
-                        new_chat = await NeonDB.execute_returning(
-                            "INSERT INTO chats (user_id, title) VALUES (%s, %s) RETURNING id",
-                            (user_id, None)
-                        )
+                        # Create new chat (empty SQL, zeroed context usage) and signal rollover
+                        new_chat = await create_chat(user_id)
                         if not new_chat:
                             raise ValueError("Failed to create new chat during rollover")
                         
-                        # Convert UUID to string for JSON serialization
-                        new_chat_id = str(new_chat["id"])
-                        
-                        # Insert initial empty SQL for new chat
-                        await NeonDB.execute(
-                            "INSERT INTO chat_sql_versions (chat_id, sql_text) VALUES (%s, %s)",
-                            (new_chat_id, "")
-                        )
-                        await update_chat_context_usage(new_chat_id, 0, 40000)
+                        # uuid columns decode as str, so the id is ready for JSON
+                        new_chat_id = new_chat["id"]
                         
                         # Signal rollover to frontend
-                        yield f"event: chat_rollover\ndata: {json.dumps({'newChatId': new_chat_id})}\n\n"
+                        yield _sse("chat_rollover", {'newChatId': new_chat_id})
                     else:
                         # Update summary normally
                         updated_summary = current_summary + new_summary_chunk
@@ -743,51 +1295,53 @@ async def generate_sse_stream(
                             base_used + len(new_summary_chunk),
                             sm_client.CONTEXT_CAP_CHARS
                         )
-                        await update_chat_context_usage(
-                            chat_id,
-                            new_used_chars,
-                            sm_client.CONTEXT_CAP_CHARS
-                        )
-                        await sm_client.update_chat_summary(chat_id, user_id, updated_summary)
-
-                        # Recalculate and fetch persisted context after each chat
-                        recalculated_context = await get_chat_context_usage(chat_id)
-                        if recalculated_context:
-                            context_data = {
-                                'chatId': str(chat_id),
-                                'usedChars': recalculated_context["usedChars"],
-                                'capChars': recalculated_context["capChars"],
-                                'usagePct': recalculated_context["usagePct"]
-                            }
-                            yield f"event: context\ndata: {json.dumps(context_data)}\n\n"
+                        
+                        async def _persist_summary(client=sm_client, summary=updated_summary, used=new_used_chars):
+                            try:
+                                await asyncio.gather(
+                                    update_chat_context_usage(chat_id, used, client.CONTEXT_CAP_CHARS),
+                                    client.update_chat_summary(chat_id, user_id, summary)
+                                )
+                                _invalidate_search_cache(chat_id)
+                            except Exception:
+                                logger.exception("⚠️  Supermemory summary update failed")
+                        
+                        # Persist out-of-band so the stream can close; report the usage we just computed
+                        _spawn_background(_persist_summary())
+                        yield _context_frame(chat_id, new_used_chars, sm_client.CONTEXT_CAP_CHARS)
                 
-                except Exception as e:
-                    import traceback
-                    print(f"⚠️  Supermemory summary update failed: {e}")
-                    print(f"⚠️  Traceback: {traceback.format_exc()}")
+                except Exception:
+                    logger.exception("⚠️  Supermemory summary update failed")
                     # Fallback to persisted context usage
                     fallback_context = await get_chat_context_usage(chat_id)
                     if fallback_context:
-                        yield f"event: context\ndata: {json.dumps({'chatId': str(chat_id), 'usedChars': fallback_context['usedChars'], 'capChars': fallback_context['capChars'], 'usagePct': fallback_context['usagePct']})}\n\n"
+                        yield _context_frame(
+                            chat_id,
+                            fallback_context['usedChars'],
+                            fallback_context['capChars'],
+                            fallback_context['usagePct']
+                        )
             else:
                 # Supermemory not configured - send 0% context
-                await update_chat_context_usage(chat_id, 0, 40000)
-                recalculated_context = await get_chat_context_usage(chat_id)
-                context_data = {
-                    'chatId': str(chat_id),
-                    'usedChars': recalculated_context["usedChars"] if recalculated_context else 0,
-                    'capChars': recalculated_context["capChars"] if recalculated_context else 40000,
-                    'usagePct': recalculated_context["usagePct"] if recalculated_context else 0
-                }
-                yield f"event: context\ndata: {json.dumps(context_data)}\n\n"
+                recalculated_context = await update_chat_context_usage(chat_id, 0, 40000)
+                if recalculated_context:
+                    yield _context_frame(
+                        chat_id,
+                        recalculated_context['usedChars'],
+                        recalculated_context['capChars'],
+                        recalculated_context['usagePct']
+                    )
+                else:
+                    yield _context_frame(chat_id, 0, 40000, 0)
         
     except Exception as e:
-        import traceback
         error_msg = str(e)
-        print(f"⚠️  Stream error: {e}")
-        print(f"⚠️  Traceback: {traceback.format_exc()}")
-        yield f"event: error\ndata: {json.dumps({'message': f'Error: {error_msg}'})}\n\n"
+        logger.exception("⚠️  Stream error")
+        yield _sse("error", {'message': f'Error: {error_msg}'})
     finally:
+        # Prefetches the model never asked for
+        for task in prefetched.values():
+            _discard_prefetch(task)
         # Flush AgentBasis data (important for serverless environments like Vercel)
         if AGENTBASIS_ENABLED:
             try:
@@ -811,41 +1365,17 @@ async def generate_sse_stream(
 async def create_new_chat(user_id: str = Depends(require_user_id)):
     """Create a new chat for the authenticated user."""
     try:
-        from .sql_tools import update_chat_context_usage
-        # Upsert user
-        await NeonDB.execute(
-            "INSERT INTO users (id) VALUES (%s) ON CONFLICT (id) DO NOTHING",
-            (user_id,)
-        )
-        
-        # Create chat
-        chat = await NeonDB.execute_returning(
-            """
-            INSERT INTO chats (user_id, title)
-            VALUES (%s, %s)
-            RETURNING id, user_id, title, created_at, updated_at
-            """,
-            (user_id, None)
-        )
+        # Upsert user, create chat and its initial empty SQL version in one statement
+        chat = await with_budget(create_chat(user_id), DB_REQUEST_BUDGET_S)
         
         if not chat:
             raise HTTPException(status_code=500, detail="Failed to create chat")
         
-        # Convert UUID to string
-        chat_id_str = str(chat["id"])
-        
-        # Insert initial empty SQL version
-        await NeonDB.execute(
-            "INSERT INTO chat_sql_versions (chat_id, sql_text) VALUES (%s, %s)",
-            (chat_id_str, "")
-        )
-        await update_chat_context_usage(chat_id_str, 0, 40000)
-        
-        # Convert UUID to string for response
-        chat["id"] = chat_id_str
-        
-        return ChatResponse(**chat, latest_sql="")
+        # Validated and serialized once via response_model (UUIDs already decode as str)
+        return {**chat, "latest_sql": ""}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create chat: {str(e)}")
 
@@ -854,26 +1384,43 @@ async def create_new_chat(user_id: str = Depends(require_user_id)):
 async def list_chats(user_id: str = Depends(require_user_id)):
     """List all chats for the authenticated user."""
     try:
-        chats = await NeonDB.fetch_all(
+        # Projection matches chats_user_updated_idx (see README) for an index-only scan.
+        # The UI opens the most recent chat right away, so that row also carries its
+        # latest SQL (one indexed lookup); the rest leave latest_sql null to keep the
+        # list small.
+        chats = await with_budget(NeonDB.fetch_all(
             """
+            WITH listed AS (
+                SELECT id, user_id, title, created_at, updated_at,
+                       COALESCE(context_used_chars, 0) AS context_used_chars,
+                       COALESCE(context_cap_chars, 40000) AS context_cap_chars,
+                       COALESCE(context_usage_pct, 0) AS context_usage_pct,
+                       context_updated_at,
+                       row_number() OVER (ORDER BY updated_at DESC) AS rn
+                FROM chats
+                WHERE user_id = $1
+            )
             SELECT id, user_id, title, created_at, updated_at,
-                   context_used_chars, context_cap_chars, context_usage_pct, context_updated_at
-            FROM chats
-            WHERE user_id = %s
-            ORDER BY updated_at DESC
+                   context_used_chars, context_cap_chars, context_usage_pct, context_updated_at,
+                   CASE WHEN rn = 1 THEN COALESCE((
+                       SELECT sql_text
+                       FROM chat_sql_versions
+                       WHERE chat_id = listed.id
+                       ORDER BY created_at DESC
+                       LIMIT 1
+                   ), '') END AS latest_sql
+            FROM listed
+            ORDER BY rn
             """,
             (user_id,)
-        )
-        
-        # Convert UUIDs to strings for JSON serialization
-        for chat in chats:
-            chat["id"] = str(chat["id"])
-            chat["context_used_chars"] = chat.get("context_used_chars") or 0
-            chat["context_cap_chars"] = chat.get("context_cap_chars") or 40000
-            chat["context_usage_pct"] = chat.get("context_usage_pct") or 0
+        ), DB_REQUEST_BUDGET_S)
         
-        return ChatListResponse(chats=[ChatResponse(**chat, latest_sql=None) for chat in chats])
+        # Rows map straight onto ChatResponse; returning them as-is lets
+        # response_model validate and serialize them in one pass
+        return {"chats": chats}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list chats: {str(e)}")
 
@@ -882,41 +1429,32 @@ async def list_chats(user_id: str = Depends(require_user_id)):
 async def get_chat(chat_id: str, user_id: str = Depends(require_user_id)):
     """Get chat details including latest SQL."""
     try:
-        # Get chat and verify ownership
-        chat = await NeonDB.fetch_one(
+        # Get chat (verifying ownership) and its latest SQL in one round-trip
+        chat = await with_budget(NeonDB.fetch_one(
             """
-            SELECT id, user_id, title, created_at, updated_at,
-                   context_used_chars, context_cap_chars, context_usage_pct, context_updated_at
-            FROM chats
-            WHERE id = %s AND user_id = %s
+            SELECT c.id, c.user_id, c.title, c.created_at, c.updated_at,
+                   COALESCE(c.context_used_chars, 0) AS context_used_chars,
+                   COALESCE(c.context_cap_chars, 40000) AS context_cap_chars,
+                   COALESCE(c.context_usage_pct, 0) AS context_usage_pct,
+                   c.context_updated_at,
+                   COALESCE(s.sql_text, '') AS latest_sql
+            FROM chats c
+            LEFT JOIN LATERAL (
+                SELECT sql_text
+                FROM chat_sql_versions
+                WHERE chat_id = c.id
+                ORDER BY created_at DESC
+                LIMIT 1
+            ) s ON true
+            WHERE c.id = $1 AND c.user_id = $2
             """,
             (chat_id, user_id)
-        )
+        ), DB_REQUEST_BUDGET_S)
         
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
         
-        # Get latest SQL
-        latest_sql_row = await NeonDB.fetch_one(
-            """
-            SELECT sql_text
-            FROM chat_sql_versions
-            WHERE chat_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-            """,
-            (chat_id,)
-        )
-        
-        latest_sql = latest_sql_row["sql_text"] if latest_sql_row else ""
-        
-        # Convert UUID to string for JSON serialization
-        chat["id"] = str(chat["id"])
-        chat["context_used_chars"] = chat.get("context_used_chars") or 0
-        chat["context_cap_chars"] = chat.get("context_cap_chars") or 40000
-        chat["context_usage_pct"] = chat.get("context_usage_pct") or 0
-        
-        return ChatResponse(**chat, latest_sql=latest_sql)
+        return chat
     
     except HTTPException:
         raise
@@ -928,24 +1466,26 @@ async def get_chat(chat_id: str, user_id: str = Depends(require_user_id)):
 async def delete_chat(chat_id: str, user_id: str = Depends(require_user_id)):
     """Delete a chat and its SQL versions."""
     try:
-        # Verify ownership
-        chat = await NeonDB.fetch_one(
-            "SELECT id FROM chats WHERE id = %s AND user_id = %s",
+        # Delete the chat (only if owned) and its SQL versions in one statement.
+        # Both deletes share a snapshot; this relies on the chat_sql_versions FK being
+        # NO ACTION (checked at statement end) or CASCADE, not RESTRICT (see README).
+        deleted = await with_budget(NeonDB.execute_returning(
+            """
+            WITH deleted_chat AS (
+                DELETE FROM chats
+                WHERE id = $1 AND user_id = $2
+                RETURNING id
+            ), deleted_versions AS (
+                DELETE FROM chat_sql_versions
+                WHERE chat_id IN (SELECT id FROM deleted_chat)
+            )
+            SELECT COUNT(*) AS n FROM deleted_chat
+            """,
             (chat_id, user_id)
-        )
-        if not chat:
+        ), DB_REQUEST_BUDGET_S)
+        if not deleted or not deleted["n"]:
             raise HTTPException(status_code=404, detail="Chat not found")
 
-        # Delete related SQL versions first
-        await NeonDB.execute(
-            "DELETE FROM chat_sql_versions WHERE chat_id = %s",
-            (chat_id,)
-        )
-        # Delete chat
-        await NeonDB.execute(
-            "DELETE FROM chats WHERE id = %s",
-            (chat_id,)
-        )
         return {"success": True}
 
     except HTTPException:
@@ -954,14 +1494,20 @@ async def delete_chat(chat_id: str, user_id: str = Depends(require_user_id)):
         raise HTTPException(status_code=500, detail=f"Failed to delete chat: {str(e)}")
 
 
+# (chat_id, user_id) -> (expires at, Q&A chunks); the UI re-lists Q&A often, so
+# serve repeats from memory for a short while. Bounded, oldest entry evicted first.
+_QA_LIST_TTL_SECONDS = 20.0
+_QA_LIST_CACHE_MAX = 1024
+_qa_list_cache: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+
+
 @app.post("/api/memory/qa")
 async def save_memory_qa(request: MemoryQARequest, user_id: str = Depends(require_user_id)):
     """Save a clarification Q&A entry to Supermemory."""
-    supermemory_api_key = os.getenv("SUPERMEMORY_API_KEY")
-    if not supermemory_api_key:
+    sm_client = app.state.supermemory
+    if sm_client is None:
         raise HTTPException(status_code=400, detail="Supermemory not configured")
     try:
-        sm_client = SupermemoryClient(supermemory_api_key)
         success = await sm_client.create_chat_qa(
             chat_id=request.chat_id,
             user_id=user_id,
@@ -970,6 +1516,8 @@ async def save_memory_qa(request: MemoryQARequest, user_id: str = Depends(requir
         )
         if not success:
             raise HTTPException(status_code=500, detail="Failed to save memory")
+        _qa_list_cache.pop((request.chat_id, user_id), None)
+        _invalidate_search_cache(request.chat_id)
         return {"success": True}
     except HTTPException:
         raise
@@ -980,16 +1528,24 @@ async def save_memory_qa(request: MemoryQARequest, user_id: str = Depends(requir
 @app.get("/api/memory/qa", response_model=MemoryQAListResponse)
 async def list_memory_qa(chat_id: str, user_id: str = Depends(require_user_id)):
     """List clarification Q&A entries for the chat."""
-    supermemory_api_key = os.getenv("SUPERMEMORY_API_KEY")
-    if not supermemory_api_key:
+    sm_client = app.state.supermemory
+    if sm_client is None:
         return MemoryQAListResponse(items=[])
-    try:
-        sm_client = SupermemoryClient(supermemory_api_key)
-        chunks = await sm_client.search_chat_qa(chat_id, user_id, query="Q:", limit=20, max_chars=6000)
-        items = [MemoryQAItem(content=chunk) for chunk in chunks]
-        return MemoryQAListResponse(items=items)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list memory: {str(e)}")
+    cache_key = (chat_id, user_id)
+    cached = _qa_list_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        chunks = cached[1]
+    else:
+        try:
+            chunks = await sm_client.search_chat_qa(chat_id, user_id, query="Q:", limit=20, max_chars=6000)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to list memory: {str(e)}")
+        # Failed searches also come back empty, so only non-empty lists are cached
+        if chunks:
+            if cache_key not in _qa_list_cache and len(_qa_list_cache) >= _QA_LIST_CACHE_MAX:
+                _qa_list_cache.pop(next(iter(_qa_list_cache)))
+            _qa_list_cache[cache_key] = (time.monotonic() + _QA_LIST_TTL_SECONDS, chunks)
+    return MemoryQAListResponse(items=[MemoryQAItem(content=chunk) for chunk in chunks])
 
 
 @app.post("/api/agent/stream")
@@ -999,26 +1555,32 @@ async def agent_stream(request: AgentStreamRequest, auth: AuthContext = Depends(
     
     Events:
     - delta: Text chunk received
-    - sql: SQL block detected/updated
+    - sql: SQL block detected/updated (full replacement)
+    - sql_delta: Text appended to the SQL sent so far
     - done: Stream complete
     - error: Error occurred
     - tool: Tool call status
     - context: Context usage update
     - chat_rollover: New chat created due to context cap
     """
-    return StreamingResponse(
-        generate_sse_stream(request, auth.user_id, session_id=auth.session_id),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+    # Frames are pre-encoded by _sse(); EventSourceResponse passes bytes through
+    # and adds keep-alive pings so proxies don't drop long tool rounds.
+    return EventSourceResponse(
+        _admitted(
+            app.state.stream_admission,
+            generate_sse_stream(request, auth.user_id, session_id=auth.session_id)
+        ),
+        ping=15,
+        sep="\n"
     )
 
 
+# Success envelope (ExecuteSQLResponse) up to the data field; the upstream result is spliced in after it
+_EXECUTE_SQL_OK_PREFIX = orjson.dumps({"success": True, "message": "SQL executed successfully!"})[:-1] + b',"data":'
+
+
 @app.post("/api/supabase/execute-sql", response_model=ExecuteSQLResponse)
-async def execute_sql(request: ExecuteSQLRequest):
+async def execute_sql(request: ExecuteSQLRequest, http_request: Request):
     """
     Execute SQL on a Supabase project via Management API.
     
@@ -1045,23 +1607,43 @@ async def execute_sql(request: ExecuteSQLRequest):
         }
         payload = {"query": request.query}
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            data = response.json() if response.content else {}
-            
-            if response.status_code >= 400:
-                return ExecuteSQLResponse(
-                    success=False,
-                    message=data.get("message", f"Error {response.status_code}: {response.reason_phrase}"),
-                    data=data
-                )
-            
+        client: httpx.AsyncClient = http_request.app.state.http_client
+        # httpx's 30s applies per read/write; the budget caps the whole call
+        response = await with_budget(
+            client.post(url, headers=headers, json=payload),
+            SUPABASE_REQUEST_BUDGET_S
+        )
+        
+        try:
+            data = orjson.loads(response.content) if response.content else {}
+        except orjson.JSONDecodeError:
+            # Not JSON (e.g. a proxy error page): report it rather than splicing it in
+            return ExecuteSQLResponse(
+                success=False,
+                message=f"Error {response.status_code}: Supabase returned a non-JSON response",
+                data=response.text[:1000]
+            )
+        
+        # Result sets can be large: the body parsed as JSON, so reuse its bytes instead
+        # of encoding `data` again
+        if response.status_code < 400 and response.content:
+            return Response(_EXECUTE_SQL_OK_PREFIX + response.content + b"}", media_type="application/json")
+        
+        if response.status_code >= 400:
             return ExecuteSQLResponse(
-                success=True,
-                message="SQL executed successfully!",
+                success=False,
+                message=data.get("message", f"Error {response.status_code}: {response.reason_phrase}"),
                 data=data
             )
+        
+        return ExecuteSQLResponse(
+            success=True,
+            message="SQL executed successfully!",
+            data=data
+        )
     
+    except HTTPException:
+        raise
     except httpx.TimeoutException:
         raise HTTPException(
             status_code=504,
@@ -1074,15 +1656,12 @@ async def execute_sql(request: ExecuteSQLRequest):
         )
 
 
-@app.get("/health")
-async def health():
-    """Health check endpoint."""
-    return {
-        "status": "ok",
-        "anthropic_configured": bool(os.getenv("ANTHROPIC_API_KEY"))
-    }
-
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8005)
+    # Worker processes need the app as an import string
+    uvicorn.run(
+        "claude_db_agent.api:app",
+        host="0.0.0.0",
+        port=8005,
+        workers=int(os.getenv("UVICORN_WORKERS", "1"))
+    )
@@ -1,19 +1,74 @@
 """Clerk JWT authentication for FastAPI."""
 
 import os
-import json
+import re
+import time
+import hashlib
+import asyncio
+import logging
 from typing import Optional, Any, Dict
 from functools import lru_cache
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import httpx
-from jose import jwt, JWTError
+import orjson
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+from jose.exceptions import JWKError
 from fastapi import HTTPException, Header, Depends
 
+logger = logging.getLogger(__name__)
+
+# Clerk rotates signing keys rarely; an unknown kid triggers an early refresh.
+# A Cache-Control max-age on the JWKS response can shorten this, down to the minimum
+JWKS_TTL_SECONDS = 3600.0
+JWKS_MIN_TTL_SECONDS = 60.0
+# Minimum gap between refreshes caused by unknown kids (forged tokens can't force a fetch per request)
+JWKS_MISS_REFRESH_SECONDS = 30.0
+
+
+# Token digest -> (expires at, verified payload). A session token is sent with every
+# request until it expires, so each one is verified once and then looked up
+VERIFIED_TOKEN_TTL_SECONDS = 300.0
+VERIFIED_TOKEN_CACHE_MAX = 4096
+_verified_tokens: Dict[bytes, "tuple[float, Dict[str, Any]]"] = {}
+
+
+def _token_digest(token: str) -> bytes:
+    """Cache key for a token; the raw token is never stored."""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _jwks_ttl(cache_control: Optional[str]) -> float:
+    """How long to keep the JWKS, from the response's Cache-Control header."""
+    match = _MAX_AGE_RE.search(cache_control or "")
+    if not match:
+        return JWKS_TTL_SECONDS
+    return min(max(float(match.group(1)), JWKS_MIN_TTL_SECONDS), JWKS_TTL_SECONDS)
+
+
+@dataclass
+class _JWKSCache:
+    """Clerk's signing keys indexed by kid, with the time they were fetched."""
+    keys_by_kid: Dict[Optional[str], Key] = field(default_factory=dict)
+    fetched_at: float = float("-inf")
+    ttl: float = JWKS_TTL_SECONDS
+    etag: Optional[str] = None
+    # Created on first use inside the running loop (on Python 3.9 a Lock binds to the
+    # loop current at construction, and this cache is built at import)
+    lock: Optional[asyncio.Lock] = None
+
 
 class ClerkAuth:
     """Clerk JWT verification."""
     
+    _jwks_cache = _JWKSCache()
+    # Keep-alive client for JWKS refreshes, created on first use; close with aclose()
+    _http_client: Optional[httpx.AsyncClient] = None
+    
     @staticmethod
     @lru_cache(maxsize=1)
     def get_jwks_url() -> str:
@@ -30,40 +85,100 @@ class ClerkAuth:
         return f"{issuer.rstrip('/')}/.well-known/jwks.json"
     
     @staticmethod
-    async def fetch_jwks() -> dict:
-        """Fetch JWKS from Clerk."""
-        jwks_url = ClerkAuth.get_jwks_url()
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(jwks_url)
+    @lru_cache(maxsize=1)
+    def get_claim_checks() -> "tuple[Optional[str], Optional[str]]":
+        """Expected (audience, issuer) from env, read once like the JWKS URL."""
+        return os.getenv("CLERK_AUDIENCE") or None, os.getenv("CLERK_ISSUER") or None
+    
+    @classmethod
+    async def fetch_jwks(cls, etag: Optional[str] = None) -> httpx.Response:
+        """Fetch JWKS from Clerk.
+        
+        With etag, the request is conditional and a 304 means the keys are unchanged.
+        """
+        jwks_url = cls.get_jwks_url()
+        if cls._http_client is None:
+            cls._http_client = httpx.AsyncClient(timeout=10.0)
+        headers = {"If-None-Match": etag} if etag else None
+        response = await cls._http_client.get(jwks_url, headers=headers)
+        if response.status_code != 304:
             response.raise_for_status()
-            return response.json()
+        return response
+    
+    @classmethod
+    async def aclose(cls) -> None:
+        """Close the JWKS HTTP client."""
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+    
+    @staticmethod
+    async def get_jwk(kid: Optional[str]) -> Optional[Key]:
+        """Signing key for kid from the cached JWKS, refreshing it when stale or on a miss.
+        
+        Keys are constructed once per refresh, so verification doesn't rebuild the
+        RSA key object from the JWK dict on every token.
+        """
+        cache = ClerkAuth._jwks_cache
+        key = cache.keys_by_kid.get(kid)
+        if key is not None and time.monotonic() - cache.fetched_at < cache.ttl:
+            return key
+        
+        if cache.lock is None:
+            cache.lock = asyncio.Lock()
+        async with cache.lock:
+            # Another request may have refreshed the keys while we waited
+            age = time.monotonic() - cache.fetched_at
+            key = cache.keys_by_kid.get(kid)
+            if age < cache.ttl and (key is not None or age < JWKS_MISS_REFRESH_SECONDS):
+                return key
+            
+            response = await ClerkAuth.fetch_jwks(cache.etag if cache.keys_by_kid else None)
+            if response.status_code != 304:
+                keys_by_kid: Dict[Optional[str], Key] = {}
+                for key_data in orjson.loads(response.content).get("keys", []):
+                    if key_data.get("kid") in keys_by_kid:
+                        continue
+                    try:
+                        keys_by_kid[key_data.get("kid")] = jwk.construct(key_data, algorithm="RS256")
+                    except JWKError:
+                        continue  # Not an RS256 key; tokens naming it fail as an unknown kid
+                cache.keys_by_kid = keys_by_kid
+                cache.etag = response.headers.get("etag")
+            cache.ttl = _jwks_ttl(response.headers.get("cache-control"))
+            cache.fetched_at = time.monotonic()
+            return cache.keys_by_kid.get(kid)
+    
+    @staticmethod
+    def invalidate_token(token: str) -> None:
+        """Forget a verified token (e.g. after sign-out) so its next use is re-verified."""
+        _verified_tokens.pop(_token_digest(token), None)
     
     @staticmethod
     async def verify_token(token: str) -> dict:
         """Verify Clerk JWT and return payload."""
+        cache_key = _token_digest(token)
+        cached = _verified_tokens.get(cache_key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+        
         try:
-            # Fetch JWKS
-            jwks = await ClerkAuth.fetch_jwks()
-            
             # Decode header to get kid
             unverified_header = jwt.get_unverified_header(token)
             kid = unverified_header.get("kid")
             
-            # Find matching key
-            key = None
-            for jwk in jwks.get("keys", []):
-                if jwk.get("kid") == kid:
-                    key = jwk
-                    break
+            # Find matching key (JWKS cached in-process)
+            key = await ClerkAuth.get_jwk(kid)
             
             if not key:
                 raise HTTPException(status_code=401, detail="Unable to find appropriate key")
             
             # Verify signature and decode
-            audience = os.getenv("CLERK_AUDIENCE")
-            issuer = os.getenv("CLERK_ISSUER")
+            audience, issuer = ClerkAuth.get_claim_checks()
             
-            payload = jwt.decode(
+            # RSA verification is CPU work; keep it off the event loop
+            payload = await asyncio.to_thread(
+                jwt.decode,
                 token,
                 key,
                 algorithms=["RS256"],
@@ -72,6 +187,15 @@ class ClerkAuth:
                 options={"verify_aud": bool(audience), "verify_iss": bool(issuer)}
             )
             
+            # Never serve a token from cache past its own expiry
+            expires_at = time.time() + VERIFIED_TOKEN_TTL_SECONDS
+            exp = payload.get("exp")
+            if isinstance(exp, (int, float)):
+                expires_at = min(expires_at, exp)
+            if cache_key not in _verified_tokens and len(_verified_tokens) >= VERIFIED_TOKEN_CACHE_MAX:
+                _verified_tokens.pop(next(iter(_verified_tokens)))
+            _verified_tokens[cache_key] = (expires_at, payload)
+            
             return payload
         
         except JWTError as e:
@@ -99,47 +223,21 @@ def _extract_session_id(payload: Dict[str, Any]) -> Optional[str]:
     return None
 
 
-async def require_user_id(authorization: Optional[str] = Header(None)) -> str:
-    """FastAPI dependency to extract and verify Clerk user ID from JWT."""
+def _extract_bearer(authorization: Optional[str]) -> str:
+    """Return the token from an "Authorization: Bearer <token>" header or raise 401."""
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
     
-    if not authorization.startswith("Bearer "):
+    if not authorization.startswith("Bearer ") or not authorization[7:]:
         raise HTTPException(status_code=401, detail="Invalid Authorization header format")
-    
-    token = authorization.split(" ", 1)[1]
-    
-    try:
-        payload = await ClerkAuth.verify_token(token)
-        user_id = payload.get("sub")
-        
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Token missing 'sub' claim")
-        
-        return user_id
-    
-    except HTTPException as e:
-        # Re-raise HTTP exceptions (already properly formatted)
-        raise
-    except Exception as e:
-        # Log the actual error for debugging
-        import traceback
-        print(f"⚠️  Auth error: {str(e)}")
-        print(f"⚠️  Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
+    return authorization[7:]
 
 
 async def require_auth_context(authorization: Optional[str] = Header(None)) -> AuthContext:
     """
     FastAPI dependency to extract Clerk user id + session id (if present) from JWT.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
-
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid Authorization header format")
-
-    token = authorization.split(" ", 1)[1]
+    token = _extract_bearer(authorization)
 
     try:
         payload = await ClerkAuth.verify_token(token)
@@ -153,7 +251,14 @@ async def require_auth_context(authorization: Optional[str] = Header(None)) -> A
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"⚠️  Auth error: {str(e)}")
-        print(f"⚠️  Traceback: {traceback.format_exc()}")
+        logger.warning("Auth error: %s", e, exc_info=True)
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
+
+
+async def require_user_id(auth: AuthContext = Depends(require_auth_context)) -> str:
+    """FastAPI dependency to extract and verify Clerk user ID from JWT.
+    
+    Resolved through require_auth_context, so FastAPI's per-request dependency cache
+    verifies the token at most once even when a route depends on both.
+    """
+    return auth.user_id
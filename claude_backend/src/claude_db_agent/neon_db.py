@@ -1,96 +1,137 @@
 """Neon Postgres database access layer."""
 
-import os
-import asyncio
+import logging
 from typing import Any, Dict, List, Optional
-from contextlib import contextmanager
-import psycopg2
-from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import asyncpg
+
+logger = logging.getLogger(__name__)
 
 
 class NeonDB:
-    """Neon Postgres connection pool and query helpers."""
+    """Neon Postgres connection pool and query helpers.
+    
+    Backed by an asyncpg pool: queries run on the event loop over the binary
+    protocol, and callers wait in pool.acquire() when every connection is busy.
+    Queries use $1, $2, ... placeholders.
+    """
+    
+    _pool: Optional[asyncpg.Pool] = None
+    # Seconds to wait for a free connection before failing the query
+    _acquire_timeout: float = 10.0
     
-    _pool: Optional[pool.ThreadedConnectionPool] = None
+    @staticmethod
+    async def _init_connection(conn: asyncpg.Connection) -> None:
+        """Per-connection setup: return UUIDs as str, as the callers expect."""
+        await conn.set_type_codec(
+            "uuid",
+            encoder=str,
+            decoder=str,
+            schema="pg_catalog",
+            format="text"
+        )
+    
+    @staticmethod
+    def _asyncpg_dsn(database_url: str) -> str:
+        """Drop libpq-only options asyncpg would send as server settings."""
+        parts = urlsplit(database_url)
+        query = [(k, v) for k, v in parse_qsl(parts.query) if k != "channel_binding"]
+        return urlunsplit(parts._replace(query=urlencode(query)))
+    
+    @staticmethod
+    def _pooled_url(database_url: str) -> str:
+        """Point a direct Neon endpoint at its PgBouncer (-pooler) hostname.
+        
+        ep-name-123.region.aws.neon.tech -> ep-name-123-pooler.region.aws.neon.tech
+        """
+        parts = urlsplit(database_url)
+        host = parts.hostname or ""  # lowercased by urlsplit
+        if not host.endswith(".neon.tech"):
+            return database_url
+        endpoint, _, domain = host.partition(".")
+        if endpoint.endswith("-pooler"):
+            return database_url
+        pooled_host = f"{endpoint}-pooler.{domain}"
+        logger.warning(
+            "DATABASE_URL uses the direct Neon endpoint %s; connecting through %s instead",
+            host, pooled_host
+        )
+        # Keep the user info exactly as written (still percent-encoded); swap in host:port
+        userinfo, at, _ = parts.netloc.rpartition("@")
+        port = f":{parts.port}" if parts.port is not None else ""
+        netloc = f"{userinfo}{at}{pooled_host}{port}"
+        return urlunsplit(parts._replace(netloc=netloc))
     
     @classmethod
-    def initialize(cls, database_url: str, min_conn: int = 1, max_conn: int = 10):
-        """Initialize connection pool."""
+    async def initialize(
+        cls,
+        database_url: str,
+        min_conn: int = 4,
+        max_conn: int = 20,
+        use_pooler: bool = True,
+        acquire_timeout: float = 10.0,
+        statement_cache_size: int = 100
+    ):
+        """Initialize connection pool.
+        
+        With use_pooler, a direct Neon endpoint is swapped for its pooled one, which
+        accepts far more client connections and skips per-connection backend setup.
+        Neon's pooler (PgBouncer, transaction mode) supports protocol-level prepared
+        statements; behind a PgBouncer without max_prepared_statements, pass
+        statement_cache_size=0.
+        """
+        if use_pooler:
+            database_url = cls._pooled_url(database_url)
+        cls._acquire_timeout = acquire_timeout
         if cls._pool is None:
-            cls._pool = pool.ThreadedConnectionPool(
-                min_conn,
-                max_conn,
-                database_url
+            cls._pool = await asyncpg.create_pool(
+                cls._asyncpg_dsn(database_url),
+                min_size=min_conn,
+                max_size=max_conn,
+                # Neon closes idle connections after 5 minutes; recycle before that
+                max_inactive_connection_lifetime=240,
+                statement_cache_size=statement_cache_size,
+                init=cls._init_connection
             )
     
     @classmethod
-    @contextmanager
-    def get_connection(cls):
-        """Get a connection from the pool."""
+    def _acquire(cls):
+        """Borrow a pooled connection, waiting at most _acquire_timeout for one."""
         if cls._pool is None:
             raise RuntimeError("Database pool not initialized. Call NeonDB.initialize() first.")
-        
-        conn = cls._pool.getconn()
-        try:
-            yield conn
-        finally:
-            cls._pool.putconn(conn)
+        return cls._pool.acquire(timeout=cls._acquire_timeout)
     
     @classmethod
     async def fetch_one(cls, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
         """Execute query and return one row as dict."""
-        def _execute():
-            with cls.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute(query, params)
-                    result = cur.fetchone()
-                    return dict(result) if result else None
-        
-        return await asyncio.to_thread(_execute)
+        async with cls._acquire() as conn:
+            result = await conn.fetchrow(query, *params)
+        return dict(result) if result else None
     
     @classmethod
     async def fetch_all(cls, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         """Execute query and return all rows as list of dicts."""
-        def _execute():
-            with cls.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute(query, params)
-                    results = cur.fetchall()
-                    return [dict(row) for row in results]
-        
-        return await asyncio.to_thread(_execute)
+        async with cls._acquire() as conn:
+            results = await conn.fetch(query, *params)
+        return [dict(row) for row in results]
     
     @classmethod
-    async def execute(cls, query: str, params: tuple = (), commit: bool = True) -> int:
+    async def execute(cls, query: str, params: tuple = ()) -> int:
         """Execute query and return rowcount."""
-        def _execute():
-            with cls.get_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(query, params)
-                    rowcount = cur.rowcount
-                    if commit:
-                        conn.commit()
-                    return rowcount
-        
-        return await asyncio.to_thread(_execute)
+        async with cls._acquire() as conn:
+            status = await conn.execute(query, *params)
+        # Command tag, e.g. "UPDATE 3" or "INSERT 0 1"; the last field is the row count
+        last = status.rsplit(" ", 1)[-1]
+        return int(last) if last.isdigit() else 0
     
     @classmethod
     async def execute_returning(cls, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
         """Execute query with RETURNING clause and return the row."""
-        def _execute():
-            with cls.get_connection() as conn:
-                with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                    cur.execute(query, params)
-                    result = cur.fetchone()
-                    conn.commit()
-                    return dict(result) if result else None
-        
-        return await asyncio.to_thread(_execute)
+        return await cls.fetch_one(query, params)
     
     @classmethod
-    def close_pool(cls):
+    async def close_pool(cls):
         """Close all connections in the pool."""
         if cls._pool:
-            cls._pool.closeall()
+            await cls._pool.close()
             cls._pool = None
@@ -1,9 +1,21 @@
 """SQL versioning tools for chat context."""
 
 import hashlib
-from typing import List, Dict, Optional
+import re
+from itertools import islice
+from typing import List, Dict, Optional, Tuple
 from .neon_db import NeonDB
 
+# chat_id -> (latest version id, compact context); bounded, oldest entry evicted first
+_COMPACT_CONTEXT_CACHE_MAX = 256
+_compact_context_cache: Dict[str, Tuple[str, str]] = {}
+
+# Object inventory for the compact context: CREATE [OR REPLACE] TABLE|VIEW|FUNCTION [IF NOT EXISTS] name
+_SQL_OBJECT_RE = re.compile(
+    r'CREATE\s+(?:OR\s+REPLACE\s+)?(TABLE|VIEW|FUNCTION)\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w."]+)',
+    re.IGNORECASE
+)
+
 
 async def get_latest_sql(chat_id: str) -> str:
     """Get the latest SQL text for a chat."""
@@ -11,7 +23,7 @@ async def get_latest_sql(chat_id: str) -> str:
         """
         SELECT sql_text
         FROM chat_sql_versions
-        WHERE chat_id = %s
+        WHERE chat_id = $1
         ORDER BY created_at DESC
         LIMIT 1
         """,
@@ -25,42 +37,57 @@ async def get_compact_sql_context(chat_id: str) -> str:
     Get a token-efficient compact SQL context.
     Includes: hash, size, object inventory, tail snippet.
     """
-    sql_text = await get_latest_sql(chat_id)
+    # One round-trip: the latest version id, plus its SQL only if it isn't the cached version
+    cached = _compact_context_cache.get(chat_id)
+    cached_version = cached[0] if cached else ""
+    result = await NeonDB.fetch_one(
+        """
+        SELECT id::text AS id,
+               CASE WHEN id::text = $1 THEN NULL ELSE sql_text END AS sql_text
+        FROM chat_sql_versions
+        WHERE chat_id = $2
+        ORDER BY created_at DESC
+        LIMIT 1
+        """,
+        (cached_version, chat_id)
+    )
+    if not result:
+        return "No SQL defined yet."
+    if cached and result["id"] == cached_version:
+        return cached[1]
     
+    sql_text = result["sql_text"]
     if not sql_text or not sql_text.strip():
-        return "No SQL defined yet."
+        context = "No SQL defined yet."
+    else:
+        sql_hash = hashlib.blake2b(sql_text.encode(), digest_size=8).hexdigest()
+        context = _build_compact_sql_context(sql_text, sql_hash)
     
-    # Calculate hash and size
-    sql_hash = hashlib.sha256(sql_text.encode()).hexdigest()[:16]
+    if chat_id not in _compact_context_cache and len(_compact_context_cache) >= _COMPACT_CONTEXT_CACHE_MAX:
+        _compact_context_cache.pop(next(iter(_compact_context_cache)))
+    _compact_context_cache[chat_id] = (result["id"], context)
+    return context
+
+
+def _build_compact_sql_context(sql_text: str, sql_hash: str) -> str:
+    """Build the compact context text for a SQL script."""
+    # Calculate size
     char_count = len(sql_text)
     line_count = sql_text.count('\n') + 1
     
-    # Extract object inventory (tables, views, functions)
-    objects = []
-    lines = sql_text.upper().split('\n')
-    for line in lines:
-        stripped = line.strip()
-        if 'CREATE TABLE' in stripped:
-            # Extract table name
-            parts = stripped.split('CREATE TABLE')
-            if len(parts) > 1:
-                table_name = parts[1].strip().split()[0].strip('(').strip()
-                objects.append(f"TABLE {table_name}")
-        elif 'CREATE VIEW' in stripped:
-            parts = stripped.split('CREATE VIEW')
-            if len(parts) > 1:
-                view_name = parts[1].strip().split()[0]
-                objects.append(f"VIEW {view_name}")
-        elif 'CREATE FUNCTION' in stripped or 'CREATE OR REPLACE FUNCTION' in stripped:
-            if 'FUNCTION' in stripped:
-                parts = stripped.split('FUNCTION')
-                if len(parts) > 1:
-                    func_name = parts[1].strip().split('(')[0]
-                    objects.append(f"FUNCTION {func_name}")
+    # Extract object inventory (tables, views, functions) in one pass, capped at 20
+    objects = [
+        f"{m.group(1).upper()} {m.group(2)}"
+        for m in islice(_SQL_OBJECT_RE.finditer(sql_text), 20)
+    ]
     
-    # Get last 10 lines as tail snippet
-    tail_lines = sql_text.split('\n')[-10:]
-    tail_snippet = '\n'.join(tail_lines)
+    # Last 10 lines as tail snippet: walk back over 10 newlines instead of splitting the script
+    tail_start = len(sql_text)
+    for _ in range(10):
+        tail_start = sql_text.rfind('\n', 0, tail_start)
+        if tail_start < 0:
+            break
+    tail_snippet = sql_text[tail_start + 1:]
     
     # Build compact context
     context_parts = [
@@ -69,7 +96,7 @@ async def get_compact_sql_context(chat_id: str) -> str:
     ]
     
     if objects:
-        context_parts.append(f"Objects: {', '.join(objects[:20])}")  # Cap at 20
+        context_parts.append(f"Objects: {', '.join(objects)}")
     
     context_parts.append(f"\nLast 10 lines:\n```sql\n{tail_snippet}\n```")
     
@@ -87,7 +114,7 @@ async def get_sql_versions(chat_id: str) -> List[Dict[str, any]]:
         """
         SELECT id, sql_text, created_at
         FROM chat_sql_versions
-        WHERE chat_id = %s
+        WHERE chat_id = $1
         ORDER BY created_at DESC
         LIMIT 2
         """,
@@ -115,17 +142,51 @@ async def restore_sql(chat_id: str, version_index: int = 0) -> str:
     
     # Insert as a new version (so restore is tracked)
     await NeonDB.execute(
-        "INSERT INTO chat_sql_versions (chat_id, sql_text) VALUES (%s, %s)",
+        "INSERT INTO chat_sql_versions (chat_id, sql_text) VALUES ($1, $2)",
         (chat_id, sql_to_restore)
     )
     
     return sql_to_restore
 
 
+async def create_chat(user_id: str) -> Optional[Dict[str, any]]:
+    """
+    Create a chat with an empty initial SQL version and zeroed context usage.
+    Upserts the user first; everything happens in one statement (one round-trip).
+    """
+    return await NeonDB.execute_returning(
+        """
+        WITH upsert_user AS (
+            INSERT INTO users (id) VALUES ($1)
+            ON CONFLICT (id) DO NOTHING
+        ),
+        new_chat AS (
+            INSERT INTO chats (
+                user_id, title,
+                context_used_chars, context_cap_chars, context_usage_pct, context_updated_at
+            )
+            VALUES ($1, NULL, 0, 40000, 0, now())
+            RETURNING id, user_id, title, created_at, updated_at
+        ),
+        initial_sql AS (
+            INSERT INTO chat_sql_versions (chat_id, sql_text)
+            SELECT id, '' FROM new_chat
+        )
+        SELECT * FROM new_chat
+        """,
+        (user_id,)
+    )
+
+
 async def save_new_sql_version(chat_id: str, sql_text: str) -> None:
-    """Save a new SQL version for the chat."""
+    """Save a new SQL version for the chat and bump its updated_at (one statement)."""
     await NeonDB.execute(
-        "INSERT INTO chat_sql_versions (chat_id, sql_text) VALUES (%s, %s)",
+        """
+        WITH new_version AS (
+            INSERT INTO chat_sql_versions (chat_id, sql_text) VALUES ($1, $2)
+        )
+        UPDATE chats SET updated_at = now() WHERE id = $1
+        """,
         (chat_id, sql_text)
     )
 
@@ -133,47 +194,56 @@ async def save_new_sql_version(chat_id: str, sql_text: str) -> None:
 async def update_chat_timestamp(chat_id: str) -> None:
     """Update the chat's updated_at timestamp."""
     await NeonDB.execute(
-        "UPDATE chats SET updated_at = now() WHERE id = %s",
+        "UPDATE chats SET updated_at = now() WHERE id = $1",
         (chat_id,)
     )
 
 
-async def get_chat_context_usage(chat_id: str) -> Optional[Dict[str, int]]:
-    """Get persisted context usage for a chat."""
+async def get_chat_context_usage(chat_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """Get persisted context usage for a chat.
+    
+    With user_id, the read doubles as the ownership check: None means the chat
+    does not exist or belongs to someone else.
+    """
     result = await NeonDB.fetch_one(
         """
-        SELECT context_used_chars, context_cap_chars, context_usage_pct
+        SELECT COALESCE(context_used_chars, 0) AS "usedChars",
+               COALESCE(NULLIF(context_cap_chars, 0), 40000) AS "capChars",
+               COALESCE(context_usage_pct, 0) AS "usagePct"
         FROM chats
-        WHERE id = %s
+        WHERE id = $1 AND ($2::text IS NULL OR user_id = $2)
         """,
-        (chat_id,)
+        (chat_id, user_id)
     )
-    if not result:
-        return None
-    return {
-        "usedChars": int(result.get("context_used_chars") or 0),
-        "capChars": int(result.get("context_cap_chars") or 40000),
-        "usagePct": int(result.get("context_usage_pct") or 0),
-    }
+    # Defaults are applied in SQL and columns are keyed as the API reports them
+    return result
 
 
 async def update_chat_context_usage(
     chat_id: str,
     used_chars: int,
     cap_chars: int = 40000
-) -> None:
-    """Persist context usage for a chat."""
+) -> Optional[Dict[str, int]]:
+    """Persist context usage for a chat.
+    
+    Returns the usage as stored (same shape as get_chat_context_usage), or None
+    if the chat does not exist, so callers don't need a read-back.
+    """
     safe_used = max(0, int(used_chars))
     safe_cap = max(1, int(cap_chars))
     usage_pct = int(min((safe_used / safe_cap) * 100, 100))
-    await NeonDB.execute(
+    result = await NeonDB.execute_returning(
         """
         UPDATE chats
-        SET context_used_chars = %s,
-            context_cap_chars = %s,
-            context_usage_pct = %s,
+        SET context_used_chars = $1,
+            context_cap_chars = $2,
+            context_usage_pct = $3,
             context_updated_at = now()
-        WHERE id = %s
+        WHERE id = $4
+        RETURNING context_used_chars AS "usedChars",
+                  context_cap_chars AS "capChars",
+                  context_usage_pct AS "usagePct"
         """,
         (safe_used, safe_cap, usage_pct, chat_id)
     )
+    return result
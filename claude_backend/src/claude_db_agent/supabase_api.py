@@ -2,11 +2,14 @@
 
 import os
 import time
+import random
 import secrets
 import string
 from datetime import datetime
 from typing import Optional, Dict, Any
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class SupabaseAPIError(Exception):
@@ -36,6 +39,21 @@ class SupabaseManager:
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
+        
+        # One keep-alive session so repeated calls (e.g. status polling) reuse the TLS connection
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+    
+    def close(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        self._session.close()
+    
+    def __enter__(self) -> "SupabaseManager":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
     
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict[Any, Any]:
         """Make a request to the Supabase API.
@@ -54,19 +72,21 @@ class SupabaseManager:
         url = f"{self.BASE_URL}/{endpoint.lstrip('/')}"
         
         try:
-            response = requests.request(method, url, headers=self.headers, **kwargs)
+            response = self._session.request(method, url, **kwargs)
             response.raise_for_status()
-            return response.json() if response.content else {}
+            return orjson.loads(response.content) if response.content else {}
         except requests.exceptions.HTTPError as e:
             error_msg = f"Supabase API error: {e}"
             try:
-                error_detail = response.json()
+                error_detail = orjson.loads(response.content)
                 error_msg += f"\nDetails: {error_detail}"
             except:
                 error_msg += f"\nResponse: {response.text}"
             raise SupabaseAPIError(error_msg)
         except requests.exceptions.RequestException as e:
             raise SupabaseAPIError(f"Request failed: {e}")
+        except orjson.JSONDecodeError as e:
+            raise SupabaseAPIError(f"Invalid JSON response: {e}")
     
     def list_organizations(self) -> list:
         """List all organizations the user belongs to.
@@ -102,8 +122,13 @@ class SupabaseManager:
             Random password string
         """
         alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
-        password = ''.join(secrets.choice(alphabet) for _ in range(length))
-        return password
+        # Map random bytes onto the alphabet in bulk (one urandom read per batch instead
+        # of one per char); bytes >= limit are rejected so every char is equally likely
+        limit = 256 - 256 % len(alphabet)
+        chars = []
+        while len(chars) < length:
+            chars.extend(alphabet[b % len(alphabet)] for b in secrets.token_bytes(length * 2) if b < limit)
+        return ''.join(chars[:length])
     
     def create_project(
         self,
@@ -162,13 +187,23 @@ class SupabaseManager:
         """
         return self._request("GET", f"/projects/{project_id}")
     
-    def wait_for_project_ready(self, project_id: str, timeout: int = 300, poll_interval: int = 5) -> Dict[str, Any]:
+    def wait_for_project_ready(
+        self,
+        project_id: str,
+        timeout: int = 300,
+        poll_interval: float = 2.0,
+        max_poll_interval: float = 15.0
+    ) -> Dict[str, Any]:
         """Wait for a project to be ready.
         
+        Polls with exponential backoff (x1.5 per check, plus up to 10% jitter so
+        concurrent waiters don't poll in lockstep).
+        
         Args:
             project_id: Project ID or ref
             timeout: Maximum time to wait in seconds
-            poll_interval: Time between status checks in seconds
+            poll_interval: Delay before the second status check in seconds
+            max_poll_interval: Upper bound on the delay between checks in seconds
             
         Returns:
             Project object when ready
@@ -176,11 +211,12 @@ class SupabaseManager:
         Raises:
             SupabaseAPIError: If project doesn't become ready within timeout
         """
-        start_time = time.time()
+        start_time = time.monotonic()
+        delay = poll_interval
         print("⏳ Waiting for project to be ready (this may take 1-2 minutes)...")
         
         while True:
-            elapsed = time.time() - start_time
+            elapsed = time.monotonic() - start_time
             if elapsed > timeout:
                 raise SupabaseAPIError(
                     f"Project did not become ready within {timeout} seconds"
@@ -188,27 +224,27 @@ class SupabaseManager:
             
             try:
                 project = self.get_project(project_id)
+            except SupabaseAPIError as e:
+                # API errors might be transient during initialization
+                print(f"  Temporary error checking status: {e}")
+            else:
                 status = project.get("status")
                 
                 if status == "ACTIVE_HEALTHY":
                     print("✓ Project is ready!")
                     return project
-                elif status in ["COMING_UP", "INIT_IN_PROGRESS", "ACTIVE_STARTING"]:
-                    print(f"  Status: {status} (waiting...)")
+                # Terminal states fail fast instead of polling until the timeout
                 elif status in ["PAUSED", "PAUSING"]:
                     raise SupabaseAPIError(f"Project is paused: {status}")
                 elif status in ["INACTIVE", "REMOVED"]:
                     raise SupabaseAPIError(f"Project creation failed: {status}")
                 else:
                     print(f"  Status: {status} (waiting...)")
-                
-            except SupabaseAPIError as e:
-                if "Project did not become ready" in str(e):
-                    raise
-                # Other errors might be transient during initialization
-                print(f"  Temporary error checking status: {e}")
             
-            time.sleep(poll_interval)
+            # Never sleep past the deadline; the next iteration raises if it's reached
+            remaining = timeout - (time.monotonic() - start_time)
+            time.sleep(max(0.0, min(delay + random.uniform(0, delay * 0.1), remaining)))
+            delay = min(delay * 1.5, max_poll_interval)
     
     def get_connection_details(self, project: Dict[str, Any]) -> Dict[str, Any]:
         """Extract database connection details from a project.
@@ -263,14 +299,15 @@ class SupabaseManager:
         Returns:
             Path to saved file
         """
-        import json
-        
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
-        with open(output_path, "w") as f:
-            json.dump(connection_details, f, indent=2)
+        # Serialize up front, then write the file in one call, created owner-only
+        payload = orjson.dumps(connection_details, option=orjson.OPT_INDENT_2)
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
         
-        # Set restrictive permissions
+        # Set restrictive permissions (covers a file that already existed)
         try:
             os.chmod(output_path, 0o600)
         except:
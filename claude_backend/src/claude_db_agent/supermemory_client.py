@@ -1,8 +1,31 @@
 """Supermemory API client for per-chat context/summary storage."""
 
 import os
-from typing import List, Dict, Optional
+import hashlib
+import logging
+from typing import List, Optional
 import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Marks a summary whose oldest context was cut to fit the cap
+_TRUNCATED_PREFIX = "...[earlier context truncated]\n"
+# Keys a search result may carry its text under, in order of preference
+_RESULT_TEXT_KEYS = ("memory", "chunk", "content")
+
+
+def _result_text(result) -> Optional[str]:
+    """Text of one search result; handles both string and nested dict structures."""
+    if isinstance(result, str):
+        return result or None
+    if not isinstance(result, dict):
+        return None
+    text = next((result[key] for key in _RESULT_TEXT_KEYS if result.get(key)), None)
+    # If text is still a dict, try to extract content from it
+    if isinstance(text, dict):
+        text = text.get("content") or text.get("text")
+    return text if text and isinstance(text, str) else None
 
 
 class SupermemoryClient:
@@ -15,12 +38,21 @@ class SupermemoryClient:
         self.api_key = api_key or os.getenv("SUPERMEMORY_API_KEY")
         if not self.api_key:
             raise ValueError("SUPERMEMORY_API_KEY not set")
+        # One keep-alive client per instance; close with aclose(). HTTP/2 multiplexes the
+        # per-turn searches and saves over a single connection to the API
+        self._client = httpx.AsyncClient(
+            timeout=30.0,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=300)
+        )
     
-    def _get_headers(self) -> Dict[str, str]:
-        return {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self._client.aclose()
     
     async def update_chat_summary(
         self,
@@ -34,37 +66,33 @@ class SupermemoryClient:
         """
         # Enforce cap
         if len(summary_content) > self.CONTEXT_CAP_CHARS:
-            # Truncate from the beginning (keep most recent context)
-            summary_content = "...[earlier context truncated]\n" + summary_content[-self.CONTEXT_CAP_CHARS:]
+            # Truncate from the beginning (keep most recent context), marker included in the cap
+            summary_content = _TRUNCATED_PREFIX + summary_content[len(_TRUNCATED_PREFIX) - self.CONTEXT_CAP_CHARS:]
         
         custom_id = f"chat_summary_{chat_id}"
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.BASE_URL}/v3/documents",
-                    headers=self._get_headers(),
-                    json={
-                        "content": summary_content,
-                        "customId": custom_id,
-                        "containerTag": user_id,
-                        "metadata": {
-                            "type": "chat_summary",
-                            "chat_id": chat_id
-                        }
+            response = await self._client.post(
+                f"{self.BASE_URL}/v3/documents",
+                content=orjson.dumps({
+                    "content": summary_content,
+                    "customId": custom_id,
+                    "containerTag": user_id,
+                    "metadata": {
+                        "type": "chat_summary",
+                        "chat_id": chat_id
                     }
-                )
-                
-                if response.status_code >= 400:
-                    print(f"⚠️  Supermemory update failed: {response.status_code} {response.text}")
-                    return False
-                
-                return True
+                })
+            )
+            
+            if response.status_code >= 400:
+                logger.warning("⚠️  Supermemory update failed: %s %s", response.status_code, response.text)
+                return False
+            
+            return True
         
         except Exception as e:
-            import traceback
-            print(f"⚠️  Supermemory update error: {str(e)}")
-            print(f"⚠️  Traceback: {traceback.format_exc()}")
+            logger.warning("⚠️  Supermemory update error: %s", e, exc_info=True)
             return False
     
     async def search_chat_memory(
@@ -83,66 +111,39 @@ class SupermemoryClient:
         if not query or not query.strip():
             return []
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.BASE_URL}/v4/search",
-                    headers=self._get_headers(),
-                    json={
-                        "q": query,
-                        "containerTag": user_id,
-                        "searchMode": "hybrid",
-                        "limit": limit,
-                        "filters": {
-                            "AND": [
-                                {"key": "type", "value": memory_type},
-                                {"key": "chat_id", "value": chat_id}
-                            ]
-                        }
+            response = await self._client.post(
+                f"{self.BASE_URL}/v4/search",
+                content=orjson.dumps({
+                    "q": query,
+                    "containerTag": user_id,
+                    "searchMode": "hybrid",
+                    "limit": limit,
+                    "filters": {
+                        "AND": [
+                            {"key": "type", "value": memory_type},
+                            {"key": "chat_id", "value": chat_id}
+                        ]
                     }
-                )
-                
-                if response.status_code >= 400:
-                    print(f"⚠️  Supermemory search failed: {response.status_code} {response.text}")
-                    return []
-                
-                data = response.json()
-                results = data.get("results", [])
-                
-                # Extract memory/chunk text and cap total length (top chunk only)
-                chunks = []
-                total_chars = 0
-                
-                for result in results:
-                    # Handle both string and nested dict structures
-                    text = None
-                    if isinstance(result, dict):
-                        # Try multiple possible keys for text content
-                        text = result.get("memory") or result.get("chunk") or result.get("content")
-                        
-                        # If text is still a dict, try to extract content from it
-                        if isinstance(text, dict):
-                            text = text.get("content") or text.get("text")
-                    elif isinstance(result, str):
-                        text = result
-                    
-                    # Ensure text is actually a string
-                    if text and isinstance(text, str):
-                        if total_chars + len(text) > max_chars:
-                            # Truncate to fit
-                            remaining = max_chars - total_chars
-                            if remaining > 100:  # Only add if meaningful
-                                chunks.append(text[:remaining] + "...")
-                            break
-                        chunks.append(text)
-                        total_chars += len(text)
-                        break
-                
-                return chunks
+                })
+            )
+            
+            if response.status_code >= 400:
+                logger.warning("⚠️  Supermemory search failed: %s %s", response.status_code, response.text)
+                return []
+            
+            data = orjson.loads(response.content)
+            results = data.get("results", [])
+            
+            # Extract memory/chunk text (top chunk only), capped at max_chars
+            text = next(filter(None, map(_result_text, results)), None)
+            if text is None:
+                return []
+            if len(text) > max_chars:
+                return [text[:max_chars] + "..."] if max_chars > 100 else []
+            return [text]
         
         except Exception as e:
-            import traceback
-            print(f"⚠️  Supermemory search error: {str(e)}")
-            print(f"⚠️  Traceback: {traceback.format_exc()}")
+            logger.warning("⚠️  Supermemory search error: %s", e, exc_info=True)
             return []
 
     async def create_chat_qa(
@@ -156,32 +157,30 @@ class SupermemoryClient:
         if not question or not answer:
             return False
         content = f"Q: {question.strip()}\nA: {answer.strip()}"
-        custom_id = f"chat_qa_{chat_id}_{abs(hash(content))}"
+        # Stable across processes (unlike hash()), so re-saving a Q&A upserts the same document
+        digest = hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+        custom_id = f"chat_qa_{chat_id}_{digest}"
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.BASE_URL}/v3/documents",
-                    headers=self._get_headers(),
-                    json={
-                        "content": content,
-                        "customId": custom_id,
-                        "containerTag": user_id,
-                        "metadata": {
-                            "type": "chat_qa",
-                            "chat_id": chat_id,
-                            "question": question.strip(),
-                            "answer": answer.strip()
-                        }
+            response = await self._client.post(
+                f"{self.BASE_URL}/v3/documents",
+                content=orjson.dumps({
+                    "content": content,
+                    "customId": custom_id,
+                    "containerTag": user_id,
+                    "metadata": {
+                        "type": "chat_qa",
+                        "chat_id": chat_id,
+                        "question": question.strip(),
+                        "answer": answer.strip()
                     }
-                )
-                if response.status_code >= 400:
-                    print(f"⚠️  Supermemory QA save failed: {response.status_code} {response.text}")
-                    return False
-                return True
+                })
+            )
+            if response.status_code >= 400:
+                logger.warning("⚠️  Supermemory QA save failed: %s %s", response.status_code, response.text)
+                return False
+            return True
         except Exception as e:
-            import traceback
-            print(f"⚠️  Supermemory QA save error: {str(e)}")
-            print(f"⚠️  Traceback: {traceback.format_exc()}")
+            logger.warning("⚠️  Supermemory QA save error: %s", e, exc_info=True)
             return False
 
     async def search_chat_qa(
@@ -121,14 +121,21 @@ Creates a new version entry for the restored SQL (so restoration is tracked)."""
 ]
 
 
+# Same tools with a prompt-cache breakpoint on the last one, so the whole tool
+# block is cached as one prefix and reused across requests and tool rounds
+_CACHED_AGENT_TOOLS: List[Dict[str, Any]] = AGENT_TOOLS[:-1] + [
+    {**AGENT_TOOLS[-1], "cache_control": {"type": "ephemeral"}}
+]
+
+
 def get_tool_definitions() -> List[Dict[str, Any]]:
     """Returns the list of tool definitions for the Anthropic API."""
-    return AGENT_TOOLS
+    return _CACHED_AGENT_TOOLS
+
+
+_TOOLS_BY_NAME: Dict[str, Dict[str, Any]] = {tool["name"]: tool for tool in AGENT_TOOLS}
 
 
 def get_tool_by_name(name: str) -> Optional[Dict[str, Any]]:
     """Get a specific tool definition by name."""
-    for tool in AGENT_TOOLS:
-        if tool["name"] == name:
-            return tool
-    return None
+    return _TOOLS_BY_NAME.get(name)
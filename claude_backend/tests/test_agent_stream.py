@@ -0,0 +1,148 @@
+"""Tests for the agent SSE stream, with the model and the database faked out."""
+
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import orjson
+
+from claude_db_agent import api
+from claude_db_agent.api_models import AgentStreamRequest
+
+
+class _FakeStream:
+    """Stands in for AsyncAnthropic.messages.stream(): yields fixed text, no tool calls."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        async def gen():
+            for chunk in self._chunks:
+                await asyncio.sleep(0)  # Let other tasks (e.g. prefetches) run, as a network read would
+                yield chunk
+        return gen()
+
+    async def get_final_message(self):
+        return SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=1, output_tokens=1),
+            content=[SimpleNamespace(type="text", text="".join(self._chunks))],
+            stop_reason="end_turn"
+        )
+
+
+def _events(frames):
+    """Parse the stream's SSE bytes into (event, data) pairs."""
+    events = []
+    for frame in b"".join(frames).split(b"\n\n"):
+        if not frame.strip():
+            continue
+        event = data = None
+        for line in frame.split(b"\n"):
+            if line.startswith(b"event:"):
+                event = line[len(b"event:"):].strip().decode()
+            elif line.startswith(b"data:"):
+                data = orjson.loads(line[len(b"data:"):])
+        events.append((event, data))
+    return events
+
+
+def _run_stream(monkeypatch, message, chunks, **overrides):
+    """Drive one turn; returns (events, DB write calls, loop exception-handler contexts)."""
+    calls = []
+    loop_errors = []
+
+    async def get_chat_context_usage(chat_id, user_id=None):
+        return {"usedChars": 0, "capChars": 40000}
+
+    async def get_latest_sql(chat_id):
+        calls.append(("get_latest_sql", chat_id))
+        return "CREATE TABLE users (id uuid);"
+
+    async def save_new_sql_version(chat_id, sql_text):
+        calls.append(("save_new_sql_version", chat_id, sql_text))
+
+    async def update_chat_timestamp(chat_id):
+        calls.append(("update_chat_timestamp", chat_id))
+
+    async def update_chat_context_usage(chat_id, used, cap):
+        return None
+
+    monkeypatch.setattr(api, "get_chat_context_usage", get_chat_context_usage)
+    monkeypatch.setattr(api, "get_latest_sql", get_latest_sql)
+    monkeypatch.setattr(api, "save_new_sql_version", save_new_sql_version)
+    monkeypatch.setattr(api, "update_chat_timestamp", update_chat_timestamp)
+    monkeypatch.setattr(api, "update_chat_context_usage", update_chat_context_usage)
+    fake_client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kwargs: _FakeStream(chunks)))
+    monkeypatch.setattr(api.app.state, "anthropic", fake_client, raising=False)
+    monkeypatch.setattr(api.app.state, "supermemory", None, raising=False)
+    for name, value in overrides.items():
+        monkeypatch.setattr(api, name, value)
+
+    async def collect():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: loop_errors.append(context))
+        request = AgentStreamRequest(message=message, chat_id="chat-1")
+        frames = [frame async for frame in api.generate_sse_stream(request, "user-1")]
+        # Let cancelled tasks and their callbacks settle, then collect dropped tasks
+        await asyncio.sleep(0.01)
+        gc.collect()
+        return frames
+
+    return _events(asyncio.run(collect())), calls, loop_errors
+
+
+def test_simple_turn_with_sql_fence_keeps_latest_sql(monkeypatch):
+    assert api.is_simple_message("hi there")
+    events, calls, _ = _run_stream(
+        monkeypatch,
+        "hi there",
+        ["Hello! For example:\n", "```sql\nSELECT 1;\n", "```\nAnything else?"]
+    )
+
+    names = [event for event, _ in events]
+    assert "sql" not in names and "sql_delta" not in names
+    done = next(data for event, data in events if event == "done")
+    assert done["finalSql"] == ""
+    assert "SELECT 1" not in done["finalText"]
+    assert calls == [("update_chat_timestamp", "chat-1")]
+
+
+def test_agent_turn_saves_changed_sql(monkeypatch):
+    events, calls, _ = _run_stream(
+        monkeypatch,
+        "add a posts table",
+        ["Done:\n", "```sql\nCREATE TABLE posts (id uuid);\n```\n"]
+    )
+
+    assert any(event in ("sql", "sql_delta") for event, _ in events)
+    saved = [call for call in calls if call[0] == "save_new_sql_version"]
+    assert len(saved) == 1
+    assert "CREATE TABLE posts" in saved[0][2]
+    assert "CREATE TABLE users" in saved[0][2]
+
+
+def test_unused_prefetch_failing_on_cancel_is_retrieved(monkeypatch):
+    async def get_compact_sql_context(chat_id):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            # e.g. a connection release that errors while the query is being torn down
+            raise RuntimeError("connection lost during cancel")
+
+    # "schema" starts a prefetch; the model answers without calling get_sql_context
+    events, _, loop_errors = _run_stream(
+        monkeypatch,
+        "what does my schema look like?",
+        ["It has a users table."],
+        get_compact_sql_context=get_compact_sql_context
+    )
+
+    assert any(event == "done" for event, _ in events)
+    assert loop_errors == []
@@ -0,0 +1,46 @@
+"""Tests for /api/execute-sql's handling of the Supabase Management API response."""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import orjson
+
+from claude_db_agent import api
+from claude_db_agent.api_models import ExecuteSQLRequest
+
+
+def _execute(status_code, content, content_type="application/json"):
+    """Run execute_sql against a canned upstream response."""
+    async def post(url, headers=None, json=None):
+        return httpx.Response(status_code, content=content, headers={"content-type": content_type})
+
+    http_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(
+        http_client=SimpleNamespace(post=post)
+    )))
+    request = ExecuteSQLRequest(projectRef="ref", accessToken="token", query="select 1")
+    return asyncio.run(api.execute_sql(request, http_request))
+
+
+def test_json_result_is_passed_through():
+    response = _execute(201, b'[{"?column?":1}]')
+
+    assert orjson.loads(response.body) == {
+        "success": True,
+        "message": "SQL executed successfully!",
+        "data": [{"?column?": 1}]
+    }
+
+
+def test_malformed_body_is_not_spliced():
+    response = _execute(200, b'[{"?column?":1}', content_type="application/json; charset=utf-8")
+
+    assert response.success is False
+    assert "non-JSON" in response.message
+
+
+def test_empty_body_falls_back_to_model():
+    response = _execute(200, b"")
+
+    assert response.success is True
+    assert response.data == {}
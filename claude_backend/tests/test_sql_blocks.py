@@ -0,0 +1,40 @@
+"""Tests for splitting streamed model text into chat text and SQL."""
+
+import pytest
+
+from claude_db_agent.api import SqlBlockSplitter, extract_sql_blocks, strip_sql_blocks
+
+
+def _split(text, cuts):
+    splitter = SqlBlockSplitter()
+    deltas = []
+    prev = 0
+    for cut in list(cuts) + [len(text)]:
+        deltas.append(splitter.feed(text[prev:cut]))
+        prev = cut
+    deltas.append(splitter.flush())
+    return splitter, "".join(deltas)
+
+
+@pytest.mark.parametrize("text", [
+    "```\n```sql\nSELECT 1;\n```",
+    # Cutting the block out joins the backticks before it with "sql" after it
+    "``````sql\nSELECT 1;\n```sql and more text",
+    "Intro ``` ```sql\nSELECT 1;\n```sql",
+    "``` ```sql\nSELECT 1;\n``` done",
+    "Text\n```sql\nCREATE TABLE a (id int);\n```\nMore\n```sql\nSELECT 2;",
+])
+def test_splitter_matches_strip_sql_blocks_for_every_split(text):
+    for first in range(len(text) + 1):
+        for second in range(first, len(text) + 1):
+            splitter, streamed = _split(text, (first, second))
+            assert splitter.clean_text == strip_sql_blocks(text), (first, second)
+            # The streamed deltas add up to the final text (up to whitespace cleanup)
+            assert streamed.split() == splitter.clean_text.split(), (first, second)
+            assert splitter.sql == extract_sql_blocks(text), (first, second)
+
+
+def test_joined_opener_never_streams_as_chat_text():
+    splitter, streamed = _split("``````sql\nSELECT 1;\n```sql", (2, 5, 8))
+    assert "```sql" not in streamed
+    assert splitter.clean_text == ""
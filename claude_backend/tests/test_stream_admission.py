@@ -0,0 +1,35 @@
+"""Tests for the agent stream admission controller."""
+
+import asyncio
+
+from claude_db_agent.api import StreamAdmission
+
+
+async def _hold(admission: StreamAdmission, release: asyncio.Event) -> None:
+    async with admission:
+        await release.wait()
+
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    async def scenario():
+        admission = StreamAdmission(1)
+        release = asyncio.Event()
+        await admission.__aenter__()
+        cancelled = asyncio.create_task(_hold(admission, release))
+        waiting = asyncio.create_task(_hold(admission, release))
+        await asyncio.sleep(0)
+
+        # Free the slot (notifying the first waiter), then cancel that waiter
+        # before it runs, as when its client disconnects while queued
+        await admission.__aexit__(None, None, None)
+        cancelled.cancel()
+
+        # The remaining waiter must still be admitted
+        await asyncio.sleep(0.01)
+        assert admission.active == 1
+        release.set()
+        await asyncio.wait_for(waiting, timeout=1)
+        assert cancelled.cancelled()
+        assert admission.active == 0
+
+    asyncio.run(scenario())